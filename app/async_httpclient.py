@@ -0,0 +1,174 @@
+import uasyncio as asyncio
+import time
+
+
+class AsyncResponse:
+
+    def __init__(self, stream, content_length=None):
+        self._stream = stream
+        self._encoding = 'utf-8'
+        # None = body ends when the server closes the socket
+        self._remaining = content_length
+        self.bytes_read = 0
+        self.elapsed_ms = 0
+
+    async def readinto(self, buf):
+        """Read body bytes into buf, returns the number of bytes read (0 at the end of the body)."""
+        if self._remaining == 0:
+            return 0
+        if self._remaining is not None and len(buf) > self._remaining:
+            buf = memoryview(buf)[:self._remaining]
+        n = await self._stream.readinto(buf)
+        if not n:
+            if self._remaining is not None:
+                raise OSError('Connection closed with {} bytes of body left'.format(self._remaining))
+            return 0
+        if self._remaining is not None:
+            self._remaining -= n
+        self.bytes_read += n
+        return n
+
+    async def read(self):
+        """Read the whole body."""
+        parts = []
+        buf = bytearray(512)
+        mv = memoryview(buf)
+        try:
+            while True:
+                n = await self.readinto(buf)
+                if not n:
+                    break
+                parts.append(bytes(mv[:n]))
+            return b''.join(parts)
+        finally:
+            await self.close()
+
+    async def save(self, path, buffer, hasher=None):
+        """Stream the body to path through buffer, returns the number of bytes written."""
+        mv = memoryview(buffer)
+        size = len(buffer)
+        start = time.ticks_ms()
+        try:
+            with open(path, 'wb') as outfile:
+                n = await self.readinto(buffer)
+                while n:
+                    data = buffer if n == size else mv[:n]
+                    outfile.write(data)
+                    if hasher is not None:
+                        hasher.update(data)
+                    n = await self.readinto(buffer)
+        finally:
+            self.elapsed_ms = time.ticks_diff(time.ticks_ms(), start)
+            await self.close()
+        return self.bytes_read
+
+    async def close(self):
+        if self._stream:
+            try:
+                self._stream.close()
+                await self._stream.wait_closed()
+            except OSError:
+                pass
+            self._stream = None
+
+
+class AsyncHttpClient:
+    """
+    Non-blocking HTTP/1.0 client on uasyncio streams.
+
+    Every request uses its own connection, so several requests can run
+    concurrently (e.g. one per download worker) while other tasks keep running.
+    """
+
+    def __init__(self, headers={}):
+        self._headers = headers
+
+    async def request(self, method, url, headers={}, max_redirects=5, _origin=None):
+        try:
+            proto, dummy, host, path = url.split('/', 3)
+        except ValueError:
+            proto, dummy, host = url.split('/', 2)
+            path = ''
+        if proto == 'http:':
+            port = 80
+        elif proto == 'https:':
+            port = 443
+        else:
+            raise ValueError('Unsupported protocol: ' + proto)
+
+        # Host header เก็บ port ไว้ด้วย (server ใช้สร้าง URL กลับมา เช่น mirror ที่ :8080)
+        netloc = host
+        if ':' in host:
+            host, port = host.split(':', 1)
+            port = int(port)
+
+        if proto == 'https:':
+            reader, writer = await asyncio.open_connection(host, port, ssl=True)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(b'%s /%s HTTP/1.0\r\nHost: %s\r\n' % (method, path, netloc))
+            overrides = [k.encode().lower() if isinstance(k, str) else k.lower() for k in headers]
+            drop = []
+            if _origin is not None and _origin != host:
+                # redirect ข้าม host (เช่น asset ไป objects.githubusercontent.com) ห้ามส่ง token ต่อ
+                drop.append(b'authorization')
+            for _headers, skip in ((self._headers, overrides + drop), (headers, drop)):
+                for k, v in _headers.items():
+                    if isinstance(k, str):
+                        k = k.encode()
+                    if isinstance(v, str):
+                        v = v.encode()
+                    if k.lower() in skip:
+                        continue
+                    writer.write(k + b': ' + v + b'\r\n')
+            writer.write(b'User-Agent: MicroPython Client\r\n\r\n')
+            await writer.drain()
+
+            l = await reader.readline()
+            if not l:
+                raise OSError('Connection closed before response')
+            l = l.split(None, 2)
+            status = int(l[1])
+            reason = ''
+            if len(l) > 2:
+                reason = l[2].rstrip()
+            content_length = None
+            resp_headers = {}
+            while True:
+                l = await reader.readline()
+                if not l or l == b'\r\n':
+                    break
+                name, _, value = l.partition(b':')
+                name = name.strip().lower()
+                resp_headers[name.decode()] = value.strip().decode()
+                if name == b'content-length':
+                    content_length = int(value)
+        except Exception:
+            writer.close()
+            raise
+
+        if method == 'HEAD' or status == 204 or status == 304:
+            content_length = 0
+        location = resp_headers.get('location')
+        if location and status in (301, 302, 303, 307, 308) and max_redirects > 0:
+            # ไม่มี body ให้ส่งต่อ (มีแค่ GET/HEAD) จึงตามไปด้วย method เดิม ยกเว้น 303
+            await AsyncResponse(reader, content_length).close()
+            if location.startswith('//'):
+                location = proto + location
+            elif '://' not in location:
+                if not location.startswith('/'):
+                    base = path.split('?', 1)[0].rpartition('/')[0]
+                    location = '/' + base + '/' + location if base else '/' + location
+                location = '{}//{}{}'.format(proto, netloc, location)
+            if status == 303:
+                method = 'GET'
+            return await self.request(method, location, headers=headers, max_redirects=max_redirects - 1, _origin=_origin or host)
+        resp = AsyncResponse(reader, content_length)
+        resp.status_code = status
+        resp.reason = reason
+        resp.headers = resp_headers
+        return resp
+
+    async def get(self, url, **kw):
+        return await self.request('GET', url, **kw)
@@ -1,25 +1,130 @@
-import usocket, os
+import usocket, os, time
 class Response:
 
-    def __init__(self, socket, saveToFile=None):
+    def __init__(self, socket, saveToFile=None, content_length=None, release=None, chunked=False, buffer=None, hasher=None, timings=None):
         self._socket = socket
         self._saveToFile = saveToFile
         self._encoding = 'utf-8'
+        # None = body ends when the server closes the socket (or at the last chunk)
+        self._remaining = content_length
+        # Transfer-Encoding: chunked -> bytes left in the current chunk, None otherwise
+        self._chunk_left = 0 if chunked else None
+        # callback that takes the socket back into the keep-alive pool
+        self._release = release
+        self.bytes_read = 0
+        self.elapsed_ms = 0
+        # เวลาแต่ละช่วง (ms): dns, connect, tls (0 เมื่อใช้ socket จาก pool), ttfb, body (จนถึง close)
+        self.timings = {} if timings is None else timings
+        self._start = time.ticks_ms()
         if saveToFile is not None:
-            CHUNK_SIZE = 512 # bytes
+            # ใช้ buffer ก้อนเดียวซ้ำทุกรอบ (readinto) แทนการสร้าง bytes ใหม่ทุก chunk -> heap ไม่แตก
+            if buffer is None:
+                buffer = bytearray(1024)
+            mv = memoryview(buffer)
+            size = len(buffer)
+            start = time.ticks_ms()
             with open(saveToFile, 'wb') as outfile:   # ✅ โหมดไบนารี่
-                CHUNK_SIZE = 1024
-                data = self._socket.read(CHUNK_SIZE)
-                while data:
+                n = self.readinto(buffer)
+                while n:
+                    data = buffer if n == size else mv[:n]
                     outfile.write(data)
-                    data = self._socket.read(CHUNK_SIZE)
-                outfile.close()
-                
+                    # hash ระหว่าง stream เลย ไม่ต้องอ่านไฟล์จาก flash ซ้ำอีกรอบ
+                    if hasher is not None:
+                        hasher.update(data)
+                    n = self.readinto(buffer)
+            self.elapsed_ms = time.ticks_diff(time.ticks_ms(), start)
+
             self.close()
 
+    def read(self, size=-1):
+        """Read up to size bytes of the body, never past Content-Length or the last chunk."""
+        if self._chunk_left is not None:
+            return self._read_chunked(size)
+        if self._remaining is None:
+            return self._socket.read() if size < 0 else self._socket.read(size)
+        if self._remaining == 0:
+            return b''
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._socket.read(size)
+        if not data:
+            raise OSError('Connection closed with {} bytes of body left'.format(self._remaining))
+        self._remaining -= len(data)
+        return data
+
+    def readinto(self, buf):
+        """Read body bytes into buf, returns the number of bytes read (0 at the end of the body)."""
+        n = self._readinto(buf)
+        self.bytes_read += n
+        return n
+
+    def _readinto(self, buf):
+        size = len(buf)
+        if self._chunk_left is not None:
+            if self._remaining == 0 or (self._chunk_left == 0 and not self._next_chunk()):
+                return 0
+            if size > self._chunk_left:
+                size = self._chunk_left
+            n = self._socket.readinto(buf, size)
+            if not n:
+                raise OSError('Connection closed with {} bytes of chunk left'.format(self._chunk_left))
+            self._chunk_left -= n
+            if self._chunk_left == 0:
+                self._socket.readline()
+            return n
+        if self._remaining is None:
+            return self._socket.readinto(buf) or 0
+        if self._remaining == 0:
+            return 0
+        if size > self._remaining:
+            size = self._remaining
+        n = self._socket.readinto(buf, size)
+        if not n:
+            raise OSError('Connection closed with {} bytes of body left'.format(self._remaining))
+        self._remaining -= n
+        return n
+
+    def _next_chunk(self):
+        # อ่านบรรทัดขนาด chunk ถัดไป, คืนค่า 0 เมื่อเจอ chunk สุดท้าย
+        l = self._socket.readline()
+        if not l:
+            raise OSError('Connection closed before last chunk')
+        # ตัด chunk extension (";name=value") ทิ้ง
+        self._chunk_left = int(l.split(b';', 1)[0].strip(), 16)
+        if self._chunk_left == 0:
+            # ข้าม trailer headers จนถึงบรรทัดว่าง
+            while True:
+                l = self._socket.readline()
+                if not l or l == b'\r\n':
+                    break
+            self._remaining = 0
+        return self._chunk_left
+
+    def _read_chunked(self, size):
+        # decode ทีละ chunk โดยไม่ buffer ทั้ง body: ใช้ memory คงที่ไม่ว่า body จะใหญ่แค่ไหน
+        if self._remaining == 0:
+            return b''
+        if self._chunk_left == 0 and not self._next_chunk():
+            return b''
+        if size < 0 or size > self._chunk_left:
+            size = self._chunk_left
+        data = self._socket.read(size)
+        if not data:
+            raise OSError('Connection closed with {} bytes of chunk left'.format(self._chunk_left))
+        self._chunk_left -= len(data)
+        if self._chunk_left == 0:
+            # CRLF ปิดท้าย chunk data
+            self._socket.readline()
+        return data
+
     def close(self):
         if self._socket:
-            self._socket.close()
+            self.timings['body'] = time.ticks_diff(time.ticks_ms(), self._start)
+            # คืน socket เข้า pool ได้เฉพาะเมื่ออ่าน body ครบพอดีแล้ว
+            if self._release is not None and self._remaining == 0:
+                self._release(self._socket)
+            else:
+                self._socket.close()
             self._socket = None
 
     @property
@@ -28,8 +133,15 @@ class Response:
             raise SystemError('You cannot get the content from the response as you decided to save it in {}'.format(self._saveToFile))
 
         try:
-            result = self._socket.read()
-            return result
+            if self._remaining is None and self._chunk_left is None:
+                return self._socket.read()
+            parts = []
+            while True:
+                data = self.read()
+                if not data:
+                    break
+                parts.append(data)
+            return b''.join(parts)
         finally:
             self.close()
 
@@ -40,26 +152,125 @@ class Response:
     def json(self):
         try:
             import ujson
-            result = ujson.load(self._socket)
-            return result
+            if self._remaining is None and self._chunk_left is None:
+                return ujson.load(self._socket)
+            return ujson.loads(self.content)
         finally:
             self.close()
 
 
 class HttpClient:
 
-    def __init__(self, headers={}):
+    def __init__(self, headers={}, keep_alive=False, pool_size=1, buffer_size=1024, dns_ttl_ms=300000):
         self._headers = headers
+        # saveToFile downloads share one preallocated buffer
+        self._buffer_size = buffer_size
+        self._buffer = None
+        # keep_alive=True: speak HTTP/1.1 and keep up to pool_size idle sockets per host
+        self._keep_alive = keep_alive
+        self._pool_size = pool_size
+        self._pool = {}
+        # (host, port) -> (addrinfo, หมดอายุเมื่อ ticks_ms) ไม่ต้องถาม DNS ทุก request
+        self._dns_ttl_ms = dns_ttl_ms
+        self._dns = {}
+        # SSLContext ใช้ร่วมทุก connection (ssl ของ MicroPython ไม่มี session resumption
+        # ทางที่ลด handshake ได้จริงคือ keep_alive ใช้ socket เดิม)
+        self._ssl_ctx = None
+        self.stats = {'opened': 0, 'reused': 0, 'resolved': 0}
+
+    def reset_stats(self):
+        for k in self.stats:
+            self.stats[k] = 0
+
+    def close(self):
+        """Close every idle pooled connection."""
+        for socks in self._pool.values():
+            for s in socks:
+                try:
+                    s.close()
+                except OSError:
+                    pass
+        self._pool = {}
+
+    def _resolve(self, host, port):
+        key = (host, port)
+        entry = self._dns.get(key)
+        now = time.ticks_ms()
+        if entry is not None and time.ticks_diff(entry[1], now) > 0:
+            return entry[0]
+        ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
+        if len(ai) < 1:
+            raise ValueError('You are not connected to the internet...')
+        ai = ai[0]
+        self._dns[key] = (ai, time.ticks_add(now, self._dns_ttl_ms))
+        self.stats['resolved'] += 1
+        return ai
+
+    def _wrap(self, s, host):
+        import ussl
+        if self._ssl_ctx is None:
+            # สร้าง context (config + RNG ของ mbedtls) ครั้งเดียว; port เก่าไม่มี SSLContext
+            try:
+                ctx = ussl.SSLContext(ussl.PROTOCOL_TLS_CLIENT)
+                ctx.verify_mode = ussl.CERT_NONE
+            except AttributeError:
+                ctx = False
+            self._ssl_ctx = ctx
+        if not self._ssl_ctx:
+            return ussl.wrap_socket(s, server_hostname=host)
+        return self._ssl_ctx.wrap_socket(s, server_hostname=host)
+
+    def _connect(self, proto, host, port, timings=None):
+        start = time.ticks_ms()
+        ai = self._resolve(host, port)
+        resolved = time.ticks_ms()
+
+        s = usocket.socket(ai[0], ai[1], ai[2])
+        try:
+            s.connect(ai[-1])
+            connected = time.ticks_ms()
+            if proto == 'https:':
+                s = self._wrap(s, host)
+        except OSError:
+            s.close()
+            # IP อาจเปลี่ยนไปแล้ว: ครั้งหน้าให้ถาม DNS ใหม่
+            self._dns.pop((host, port), None)
+            raise
+        if timings is not None:
+            timings['dns'] = time.ticks_diff(resolved, start)
+            timings['connect'] = time.ticks_diff(connected, resolved)
+            timings['tls'] = time.ticks_diff(time.ticks_ms(), connected)
+        self.stats['opened'] += 1
+        return s
+
+    def _acquire(self, key, timings=None):
+        socks = self._pool.get(key)
+        if socks:
+            self.stats['reused'] += 1
+            return socks.pop(), True
+        return self._connect(key[0], key[1], key[2], timings), False
+
+    def _release(self, key, s):
+        socks = self._pool.setdefault(key, [])
+        if len(socks) < self._pool_size:
+            socks.append(s)
+        else:
+            s.close()
 
-    def request(self, method, url, data=None, json=None, file=None, custom=None, saveToFile=None, headers={}, stream=None):
-        def _write_headers(sock, _headers):
+    def request(self, method, url, data=None, json=None, file=None, custom=None, saveToFile=None, headers={}, stream=None, max_redirects=5, hasher=None, _origin=None):
+        def _write_headers(head, _headers, skip):
             # _headers อาจเป็น dict ของ str หรือ bytes ปนกัน
             for k, v in _headers.items():
                 if isinstance(k, str):
                     k = k.encode()
                 if isinstance(v, str):
                     v = v.encode()
-                sock.write(k + b': ' + v + b'\r\n')
+                if k.lower() in skip:
+                    continue
+                head += k
+                head += b': '
+                head += v
+                head += b'\r\n'
 
         try:
             proto, dummy, host, path = url.split('/', 3)
@@ -69,87 +280,153 @@ class HttpClient:
         if proto == 'http:':
             port = 80
         elif proto == 'https:':
-            import ussl
             port = 443
         else:
             raise ValueError('Unsupported protocol: ' + proto)
 
+        # Host header เก็บ port ไว้ด้วย (server ใช้สร้าง URL กลับมา เช่น mirror ที่ :8080)
+        netloc = host
         if ':' in host:
             host, port = host.split(':', 1)
             port = int(port)
 
-        ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
-        if len(ai) < 1:
-            raise ValueError('You are not connected to the internet...')
-        ai = ai[0]
+        if json is not None:
+            assert data is None
+            import ujson
+            data = ujson.dumps(json)
+            if isinstance(data, str):
+                data = data.encode()
 
-        s = usocket.socket(ai[0], ai[1], ai[2])
-        try:
-            s.connect(ai[-1])
-            if proto == 'https:':
-                s = ussl.wrap_socket(s, server_hostname=host)
-            s.write(b'%s /%s HTTP/1.0\r\n' % (method, path))
-            if not 'Host' in headers:
-                s.write(b'Host: %s\r\n' % host)
-            # Iterate over keys to avoid tuple alloc
-            _write_headers(s, self._headers)
-            _write_headers(s, headers)
-
-            # add user agent
-            s.write(b'User-Agent: MicroPython Client\r\n')
-            if json is not None:
-                assert data is None
-                import ujson
-                data = ujson.dumps(json)
-                if isinstance(data, str):
-                    data = data.encode()
-                s.write(b'Content-Type: application/json\r\n')
-
-            if data:
-                s.write(b'Content-Length: %d\r\n' % len(data))
-                s.write(b'\r\n')
-                s.write(data)
-            elif file:
-                size = os.stat(file)[6]
-                s.write(b'Content-Length: %d\r\n' % size)
-                s.write(b'\r\n')
-                with open(file, 'rb') as file_object:
-                    while True:
-                        chunk = file_object.read(1024)
-                        if not chunk:
-                            break
-                        s.write(chunk)
-            elif custom:
-                s.write(b'\r\n')
-                custom(s)
+        # header ที่ส่งมากับ request ทับ header default ของ client ที่ชื่อเดียวกัน
+        overrides = [k.encode().lower() if isinstance(k, str) else k.lower() for k in headers]
+        skip = []
+        if _origin is not None and _origin != host:
+            # redirect ข้าม host (เช่น asset ไป objects.githubusercontent.com) ห้ามส่ง token ต่อ
+            skip.append(b'authorization')
+
+        key = (proto, host, port)
+        # socket ที่ค้างใน pool อาจถูก server ปิดไปแล้ว -> ลองใหม่ด้วย connection ใหม่หนึ่งครั้ง
+        while True:
+            timings = {'dns': 0, 'connect': 0, 'tls': 0}
+            if self._keep_alive:
+                s, reused = self._acquire(key, timings)
             else:
-                s.write(b'\r\n')
+                s, reused = self._connect(proto, host, port, timings), False
+            try:
+                sent = time.ticks_ms()
+                # ประกอบ request line + header ใน buffer เดียวแล้ว write ครั้งเดียว
+                # (write ทีละบรรทัด = TLS record ละบรรทัด และโดน Nagle/delayed ACK หน่วง)
+                head = bytearray(b'%s /%s HTTP/1.%d\r\n' % (method, path, 1 if self._keep_alive else 0))
+                if not 'Host' in headers:
+                    head += b'Host: %s\r\n' % netloc
+                # Iterate over keys to avoid tuple alloc
+                _write_headers(head, self._headers, overrides + skip)
+                _write_headers(head, headers, skip)
 
+                # add user agent
+                head += b'User-Agent: MicroPython Client\r\n'
+                if json is not None:
+                    head += b'Content-Type: application/json\r\n'
+
+                if data:
+                    head += b'Content-Length: %d\r\n\r\n' % len(data)
+                    s.write(head)
+                    s.write(data)
+                elif file:
+                    size = os.stat(file)[6]
+                    head += b'Content-Length: %d\r\n\r\n' % size
+                    s.write(head)
+                    with open(file, 'rb') as file_object:
+                        while True:
+                            chunk = file_object.read(1024)
+                            if not chunk:
+                                break
+                            s.write(chunk)
+                elif custom:
+                    head += b'\r\n'
+                    s.write(head)
+                    custom(s)
+                else:
+                    head += b'\r\n'
+                    s.write(head)
+                head = None
 
-            l = s.readline()
-            # print(l)
-            l = l.split(None, 2)
-            status = int(l[1])
-            reason = ''
-            if len(l) > 2:
-                reason = l[2].rstrip()
-            while True:
                 l = s.readline()
-                if not l or l == b'\r\n':
-                    break
                 # print(l)
-                if l.startswith(b'Transfer-Encoding:'):
-                    if b'chunked' in l:
-                        raise ValueError('Unsupported ' + l)
-                elif l.startswith(b'Location:') and not 200 <= status <= 299:
-                    raise NotImplementedError('Redirects not yet supported')
-        except OSError:
-            s.close()
-            raise
+                if not l:
+                    raise OSError('Connection closed before response')
+                timings['ttfb'] = time.ticks_diff(time.ticks_ms(), sent)
+                l = l.split(None, 2)
+                status = int(l[1])
+                reason = ''
+                if len(l) > 2:
+                    reason = l[2].rstrip()
+                # HTTP/1.0 server ปิด connection หลังตอบเสมอ
+                reusable = self._keep_alive and l[0] == b'HTTP/1.1'
+                content_length = None
+                chunked = False
+                resp_headers = {}
+                while True:
+                    l = s.readline()
+                    if not l or l == b'\r\n':
+                        break
+                    # print(l)
+                    name, _, value = l.partition(b':')
+                    name = name.strip().lower()
+                    # header name เป็นตัวพิมพ์เล็กเสมอ เช่น resp.headers['etag']
+                    resp_headers[name.decode()] = value.strip().decode()
+                    if name == b'transfer-encoding':
+                        chunked = b'chunked' in value.lower()
+                    elif name == b'content-length':
+                        content_length = int(value)
+                    elif name == b'connection':
+                        if b'close' in value.lower():
+                            reusable = False
+            except OSError:
+                s.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                s.close()
+                raise
+            break
 
-        resp = Response(s, saveToFile)
+        if method == 'HEAD' or status == 204 or status == 304:
+            content_length = 0
+            chunked = False
+        elif chunked:
+            # RFC 7230: ถ้ามี chunked ให้ไม่สน Content-Length
+            content_length = None
+        release = None
+        if reusable and (content_length is not None or chunked):
+            release = lambda sock: self._release(key, sock)
+
+        location = resp_headers.get('location')
+        if location and status in (301, 302, 303, 307, 308) and max_redirects > 0:
+            # ปิด response ของ redirect (body ส่วนมากว่าง) แล้วตามไป location ใหม่
+            Response(s, None, content_length, release, chunked).close()
+            if location.startswith('//'):
+                location = proto + location
+            elif '://' not in location:
+                if not location.startswith('/'):
+                    # relative: ต่อจากโฟลเดอร์ของ path ปัจจุบัน (ตัด query ออก)
+                    base = path.split('?', 1)[0].rpartition('/')[0]
+                    location = '/' + base + '/' + location if base else '/' + location
+                location = '{}//{}{}'.format(proto, netloc, location)
+            if status == 303 or (status in (301, 302) and method != 'HEAD'):
+                method, data, json, file, custom = 'GET', None, None, None, None
+            elif json is not None:
+                # 307/308 ส่ง body เดิม: ส่ง json= ต่อไปให้ได้ Content-Type เหมือนเดิม
+                data = None
+            return self.request(method, location, data=data, json=json, file=file, custom=custom, saveToFile=saveToFile, headers=headers, max_redirects=max_redirects - 1, hasher=hasher, _origin=_origin or host)
+
+        if saveToFile is not None and self._buffer is None:
+            self._buffer = bytearray(self._buffer_size)
+        resp = Response(s, saveToFile, content_length, release, chunked, self._buffer, hasher, timings)
         resp.status_code = status
         resp.reason = reason
+        resp.headers = resp_headers
         return resp
 
     def head(self, url, **kw):
@@ -169,4 +446,3 @@ class HttpClient:
 
     def delete(self, url, **kw):
         return self.request('DELETE', url, **kw)
-
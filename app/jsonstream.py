@@ -0,0 +1,259 @@
+# jsonstream.py - pull-style JSON scanner สำหรับ response ขนาดใหญ่
+# อ่านทีละ buffer เล็ก ๆ แล้วเก็บเฉพาะ key ที่ต้องการ ส่วนที่เหลือข้ามไปโดยไม่สร้าง object
+
+_SPACE = 0x20
+_TAB = 0x09
+_LF = 0x0A
+_CR = 0x0D
+_QUOTE = 0x22
+_BACKSLASH = 0x5C
+_COMMA = 0x2C
+_COLON = 0x3A
+_LBRACE = 0x7B
+_RBRACE = 0x7D
+_LBRACKET = 0x5B
+_RBRACKET = 0x5D
+
+_ESCAPES = {0x22: 0x22, 0x5C: 0x5C, 0x2F: 0x2F, 0x62: 0x08, 0x66: 0x0C, 0x6E: 0x0A, 0x72: 0x0D, 0x74: 0x09}
+
+
+class JsonStream:
+    """
+    Scan a JSON document from any object with readinto() (e.g. Response or a file)
+    using a fixed-size buffer.
+
+    - pick(keys): parse the object at the current position, keep only keys
+    - items(keys): iterate the array at the current position one element at a time
+    - seek(key): move into the object at the current position, up to the value of key
+    - load(): parse the value at the current position completely
+    """
+
+    def __init__(self, stream, buffer_size=256):
+        self._stream = stream
+        self._buf = bytearray(buffer_size)
+        self._len = 0
+        self._pos = 0
+
+    def _fill(self):
+        self._len = self._stream.readinto(self._buf) or 0
+        self._pos = 0
+        if not self._len:
+            raise ValueError('Unexpected end of JSON')
+
+    def _next(self):
+        if self._pos >= self._len:
+            self._fill()
+        c = self._buf[self._pos]
+        self._pos += 1
+        return c
+
+    def _token(self):
+        c = self._next()
+        while c == _SPACE or c == _LF or c == _CR or c == _TAB:
+            c = self._next()
+        return c
+
+    def _expect(self, c, expected, what):
+        if c != expected:
+            raise ValueError('Expected {} at {!r}'.format(what, chr(c)))
+
+    def _string(self):
+        out = bytearray()
+        while True:
+            c = self._next()
+            if c == _QUOTE:
+                return str(out, 'utf-8')
+            if c != _BACKSLASH:
+                out.append(c)
+                continue
+            c = self._next()
+            if c == 0x75:  # \uXXXX
+                cp = self._hex4()
+                if 0xD800 <= cp < 0xDC00:
+                    # surrogate pair -> code point เดียว
+                    self._next()
+                    self._next()
+                    cp = 0x10000 + ((cp - 0xD800) << 10) + (self._hex4() - 0xDC00)
+                out.extend(chr(cp).encode())
+            else:
+                out.append(_ESCAPES.get(c, c))
+
+    def _hex4(self):
+        return int(str(bytes([self._next(), self._next(), self._next(), self._next()]), 'ascii'), 16)
+
+    def _number(self, c):
+        out = bytearray()
+        is_float = False
+        while True:
+            if c == 0x2E or c == 0x65 or c == 0x45:  # . e E
+                is_float = True
+            elif not (0x30 <= c <= 0x39 or c == 0x2D or c == 0x2B):  # 0-9 - +
+                self._pos -= 1
+                break
+            out.append(c)
+            if self._pos >= self._len:
+                # เลขที่อยู่ท้ายเอกสารพอดี
+                self._len = self._stream.readinto(self._buf) or 0
+                self._pos = 0
+                if not self._len:
+                    break
+            c = self._next()
+        out = str(out, 'ascii')
+        return float(out) if is_float else int(out)
+
+    def _value(self, c):
+        if c == _QUOTE:
+            return self._string()
+        if c == _LBRACE:
+            obj = {}
+            c = self._token()
+            if c == _RBRACE:
+                return obj
+            while True:
+                self._expect(c, _QUOTE, 'key')
+                key = self._string()
+                self._expect(self._token(), _COLON, "':'")
+                obj[key] = self._value(self._token())
+                c = self._token()
+                if c == _RBRACE:
+                    return obj
+                self._expect(c, _COMMA, "','")
+                c = self._token()
+        if c == _LBRACKET:
+            arr = []
+            c = self._token()
+            if c == _RBRACKET:
+                return arr
+            while True:
+                arr.append(self._value(c))
+                c = self._token()
+                if c == _RBRACKET:
+                    return arr
+                self._expect(c, _COMMA, "','")
+                c = self._token()
+        if c == 0x74:  # true
+            self._skip_scalar()
+            return True
+        if c == 0x66:  # false
+            self._skip_scalar()
+            return False
+        if c == 0x6E:  # null
+            self._skip_scalar()
+            return None
+        return self._number(c)
+
+    def _skip_string(self):
+        escaped = False
+        while True:
+            buf = self._buf
+            pos = self._pos
+            end = self._len
+            while pos < end:
+                c = buf[pos]
+                pos += 1
+                if escaped:
+                    escaped = False
+                elif c == _BACKSLASH:
+                    escaped = True
+                elif c == _QUOTE:
+                    self._pos = pos
+                    return
+            self._pos = pos
+            self._fill()
+
+    def _skip_scalar(self):
+        while True:
+            c = self._next()
+            if c == _COMMA or c == _RBRACE or c == _RBRACKET or c == _SPACE or c == _LF or c == _CR or c == _TAB:
+                self._pos -= 1
+                return
+
+    def _skip(self, c):
+        """Skip the value starting with c without building it."""
+        if c == _QUOTE:
+            self._skip_string()
+        elif c == _LBRACE or c == _LBRACKET:
+            depth = 1
+            while depth:
+                c = self._next()
+                if c == _QUOTE:
+                    self._skip_string()
+                elif c == _LBRACE or c == _LBRACKET:
+                    depth += 1
+                elif c == _RBRACE or c == _RBRACKET:
+                    depth -= 1
+        else:
+            self._skip_scalar()
+
+    def _pick(self, c, keys):
+        self._expect(c, _LBRACE, 'object')
+        out = {}
+        c = self._token()
+        if c == _RBRACE:
+            return out
+        while True:
+            self._expect(c, _QUOTE, 'key')
+            key = self._string()
+            self._expect(self._token(), _COLON, "':'")
+            c = self._token()
+            if key in keys:
+                out[key] = self._value(c)
+            else:
+                self._skip(c)
+            c = self._token()
+            if c == _RBRACE:
+                return out
+            self._expect(c, _COMMA, "','")
+            c = self._token()
+
+    def pick(self, keys):
+        """Parse the object at the current position and return a dict with only keys."""
+        return self._pick(self._token(), keys)
+
+    def items(self, keys=None):
+        """Yield the array elements at the current position one at a time.
+
+        Object elements are reduced to keys when keys is given.
+        """
+        c = self._token()
+        self._expect(c, _LBRACKET, 'array')
+        c = self._token()
+        if c == _RBRACKET:
+            return
+        while True:
+            if keys is not None and c == _LBRACE:
+                yield self._pick(c, keys)
+            else:
+                yield self._value(c)
+            c = self._token()
+            if c == _RBRACKET:
+                return
+            self._expect(c, _COMMA, "','")
+            c = self._token()
+
+    def seek(self, key):
+        """Enter the object at the current position and stop at the value of key.
+
+        Returns False (with the object fully consumed) if key is missing.
+        """
+        c = self._token()
+        self._expect(c, _LBRACE, 'object')
+        c = self._token()
+        if c == _RBRACE:
+            return False
+        while True:
+            self._expect(c, _QUOTE, 'key')
+            name = self._string()
+            self._expect(self._token(), _COLON, "':'")
+            if name == key:
+                return True
+            self._skip(self._token())
+            c = self._token()
+            if c == _RBRACE:
+                return False
+            self._expect(c, _COMMA, "','")
+            c = self._token()
+
+    def load(self):
+        """Parse the value at the current position completely."""
+        return self._value(self._token())
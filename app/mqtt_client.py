@@ -0,0 +1,352 @@
+# mqtt_client.py - MQTT 3.1.1 client บน uasyncio streams
+# connect/publish/ping ไม่บล็อก event loop (umqtt.simple บล็อกทั้ง loop ระหว่างรอ broker)
+import uasyncio as asyncio
+import struct
+import time
+
+_CONNECT = 0x10
+_CONNACK = 0x20
+_PUBLISH = 0x30
+_PUBACK = 0x40
+_SUBSCRIBE = 0x82
+_PINGREQ = b'\xc0\x00'
+_DISCONNECT = b'\xe0\x00'
+
+
+def _varint(n, out):
+    # remaining length ของ fixed header (7 bit ต่อ byte)
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return out
+
+
+def _bytes(s):
+    return s.encode() if isinstance(s, str) else s
+
+
+def _copy(buf, pos, data):
+    # ทีละ byte: ไม่สร้าง slice object (slice assignment อาจ allocate บน MicroPython รุ่นเก่า)
+    for b in data:
+        buf[pos] = b
+        pos += 1
+    return pos
+
+
+class AsyncMQTTClient:
+    """
+    Minimal MQTT 3.1.1 client on uasyncio streams.
+
+    connect(), publish() and disconnect() are coroutines that only wait on the network,
+    so other tasks (LED, watchdog, OTA) keep running on a slow or dead broker.
+    After connect() a reader task handles incoming packets (PUBLISH -> cb(topic, msg))
+    and a keepalive task sends PINGREQ when nothing was sent for keepalive / 2 seconds
+    and drops the connection if the broker stays silent for 1.5 * keepalive.
+
+    QoS 1 publishes are pipelined: up to `window` packets may wait for their PUBACK at
+    once (publish() only blocks while the window is full). Unacked packets are resent
+    with the DUP flag after ack_timeout_ms and again after the next connect(), so the
+    client object should be kept across reconnects.
+
+    QoS 0 packets up to out_size bytes are assembled in one reusable buffer, so a
+    publish with bytes topic/payload does not allocate packet memory.
+    """
+
+    def __init__(self, client_id, server, port=1883, user=None, password=None, keepalive=60, ssl=False,
+                 window=8, ack_timeout_ms=5000, out_size=256):
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.keepalive = keepalive
+        self.ssl = ssl
+        # cb(topic: bytes, msg: bytes) สำหรับข้อความขาเข้า
+        self.cb = None
+        self.connected = False
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+        self._tasks = []
+        self._last_tx = 0
+        self._last_rx = 0
+        self.window = window
+        self.ack_timeout_ms = ack_timeout_ms
+        # packet id -> [packet, ms ที่ส่งล่าสุด] ของ QoS 1 ที่ยังไม่ได้ PUBACK
+        self._inflight = {}
+        self._pid = 0
+        self._acked = asyncio.Event()
+        self.stats = {'acked': 0, 'retransmits': 0}
+        self._will = None
+        self._out = bytearray(out_size)
+        self._out_mv = memoryview(self._out)
+
+    def set_last_will(self, topic, msg, retain=False, qos=0):
+        """Message the broker publishes for us when the connection dies without DISCONNECT."""
+        self._will = (_bytes(topic), _bytes(msg), retain, qos)
+
+    async def connect(self, clean_session=True, timeout=10):
+        """Open the connection and wait for CONNACK, returns the broker's session-present flag."""
+        if self.ssl:
+            opener = asyncio.open_connection(self.server, self.port, ssl=True)
+        else:
+            opener = asyncio.open_connection(self.server, self.port)
+        self._reader, self._writer = await asyncio.wait_for(opener, timeout)
+        try:
+            body = bytearray(b'\x00\x04MQTT\x04\x00')
+            flags = 0x02 if clean_session else 0
+            body += struct.pack('!H', self.keepalive)
+            fields = [self.client_id]
+            if self._will:
+                topic, msg, retain, qos = self._will
+                flags |= 0x04 | qos << 3 | (0x20 if retain else 0)
+                fields += (topic, msg)
+            for field, flag in ((self.user, 0x80), (self.password, 0x40)):
+                if field is not None:
+                    flags |= flag
+                    fields.append(field)
+            for field in fields:
+                field = _bytes(field)
+                body += struct.pack('!H', len(field))
+                body += field
+            body[7] = flags
+            pkt = _varint(len(body), bytearray([_CONNECT]))
+            pkt += body
+            await self._send(pkt)
+            resp = await asyncio.wait_for(self._reader.readexactly(4), timeout)
+            if resp[0] != _CONNACK or resp[3] != 0:
+                raise OSError('MQTT connect refused: {}'.format(resp[3]))
+        except Exception:
+            self._close()
+            raise
+        self.connected = True
+        self._last_rx = time.ticks_ms()
+        self._tasks = [asyncio.create_task(self._read_loop()), asyncio.create_task(self._retry_loop())]
+        if self.keepalive:
+            self._tasks.append(asyncio.create_task(self._keepalive_loop()))
+        # QoS 1 ที่ค้างจากการเชื่อมต่อก่อน: ส่งซ้ำทันที
+        for entry in list(self._inflight.values()):
+            await self._resend(entry)
+        return bool(resp[2] & 1)
+
+    async def publish(self, topic, msg, retain=False, qos=0):
+        """
+        Send one PUBLISH. For qos=1 returns the packet id once it is sent, not acked.
+        If the send fails nothing is kept in flight: the caller owns the message again.
+        """
+        if qos:
+            while len(self._inflight) >= self.window and self.connected:
+                self._acked.clear()
+                await self._acked.wait()
+        if not self.connected:
+            raise OSError('MQTT not connected')
+        topic = _bytes(topic)
+        msg = _bytes(msg)
+        n = 2 + len(topic) + len(msg)
+        if not qos and n + 5 <= len(self._out):
+            await self._publish_in_place(topic, msg, n, retain)
+            return None
+        # ประกอบเป็น packet เดียวแล้ว write ครั้งเดียว (write แยกชิ้นโดน Nagle หน่วงรอ ACK)
+        pkt = _varint(n + 2 if qos else n, bytearray([_PUBLISH | (0x02 if qos else 0) | (1 if retain else 0)]))
+        pkt += struct.pack('!H', len(topic))
+        pkt += topic
+        pid = None
+        if qos:
+            pid = self._next_pid()
+            pkt += struct.pack('!H', pid)
+            self._inflight[pid] = [pkt, time.ticks_ms()]
+        pkt += msg
+        try:
+            await self._send(pkt)
+        except Exception:
+            # ไม่เก็บไว้ส่งซ้ำตอน connect: ผู้เรียกได้ exception แล้วเอาไปเข้าคิวเอง (ไม่งั้นถึงสองรอบ)
+            if pid is not None:
+                self._inflight.pop(pid, None)
+            raise
+        return pid
+
+    async def subscribe(self, topics, qos=0):
+        """Subscribe to one topic filter or a list of them in a single SUBSCRIBE packet."""
+        if not self.connected:
+            raise OSError('MQTT not connected')
+        if isinstance(topics, (str, bytes)):
+            topics = (topics,)
+        body = bytearray(struct.pack('!H', self._next_pid()))
+        for topic in topics:
+            topic = _bytes(topic)
+            body += struct.pack('!H', len(topic))
+            body += topic
+            body.append(qos)
+        pkt = _varint(len(body), bytearray([_SUBSCRIBE]))
+        pkt += body
+        # SUBACK ไม่ต้องรอ: broker ทำตามลำดับ packet อยู่แล้ว
+        await self._send(pkt)
+
+    async def _publish_in_place(self, topic, msg, n, retain):
+        # ประกอบใน buffer เดิมระหว่างถือ lock (write ก่อนหน้ายังใช้ buffer อยู่จนกว่าจะ drain เสร็จ)
+        async with self._lock:
+            buf = self._out
+            buf[0] = _PUBLISH | (1 if retain else 0)
+            pos = 1
+            while True:
+                b = n & 0x7F
+                n >>= 7
+                if n:
+                    buf[pos] = b | 0x80
+                    pos += 1
+                else:
+                    buf[pos] = b
+                    pos += 1
+                    break
+            buf[pos] = len(topic) >> 8
+            buf[pos + 1] = len(topic) & 0xFF
+            pos = _copy(buf, pos + 2, topic)
+            pos = _copy(buf, pos, msg)
+            await self._write(self._out_mv[:pos])
+
+    def _next_pid(self):
+        while True:
+            self._pid = self._pid % 0xFFFF + 1
+            if self._pid not in self._inflight:
+                return self._pid
+
+    def pending(self):
+        """Number of QoS 1 packets still waiting for PUBACK."""
+        return len(self._inflight)
+
+    async def wait_acked(self, timeout_ms=5000):
+        """Wait until every QoS 1 packet is acked, False on timeout or disconnect."""
+        deadline = time.ticks_add(time.ticks_ms(), timeout_ms)
+        while self._inflight and self.connected:
+            left = time.ticks_diff(deadline, time.ticks_ms())
+            if left <= 0:
+                return False
+            self._acked.clear()
+            try:
+                await asyncio.wait_for_ms(self._acked.wait(), left)
+            except asyncio.TimeoutError:
+                return False
+        return not self._inflight
+
+    async def _resend(self, entry):
+        # DUP flag บอก broker ว่าเป็นการส่งซ้ำ
+        entry[0][0] |= 0x08
+        entry[1] = time.ticks_ms()
+        self.stats['retransmits'] += 1
+        await self._send(entry[0])
+
+    async def ping(self):
+        await self._send(_PINGREQ)
+
+    async def disconnect(self):
+        if self.connected:
+            try:
+                await self._send(_DISCONNECT)
+            except OSError:
+                pass
+        self._close()
+
+    async def _send(self, pkt):
+        async with self._lock:
+            await self._write(pkt)
+
+    async def _write(self, pkt):
+        # เรียกขณะถือ self._lock
+        try:
+            self._writer.write(pkt)
+            await self._writer.drain()
+        except Exception:
+            self._close()
+            raise
+        self._last_tx = time.ticks_ms()
+
+    def _close(self):
+        self.connected = False
+        # ปลุก publish()/wait_acked() ที่รอ window อยู่
+        self._acked.set()
+        try:
+            current = asyncio.current_task()
+        except RuntimeError:
+            current = None
+        for task in self._tasks:
+            if task is not current:
+                task.cancel()
+        self._tasks = []
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except OSError:
+                pass
+        self._reader = self._writer = None
+
+    async def _read_length(self):
+        n = 0
+        shift = 0
+        while True:
+            b = (await self._reader.readexactly(1))[0]
+            n |= (b & 0x7F) << shift
+            if not b & 0x80:
+                return n
+            shift += 7
+
+    async def _read_loop(self):
+        try:
+            while True:
+                op = (await self._reader.readexactly(1))[0]
+                n = await self._read_length()
+                body = await self._reader.readexactly(n) if n else b''
+                self._last_rx = time.ticks_ms()
+                if op & 0xF0 == _PUBLISH:
+                    await self._on_publish(op, body)
+                elif op == _PUBACK and self._inflight.pop(struct.unpack('!H', body)[0], None):
+                    self.stats['acked'] += 1
+                    self._acked.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print('[MQTT] Connection lost:', e)
+            self._close()
+
+    async def _on_publish(self, op, body):
+        topic_len = struct.unpack_from('!H', body)[0]
+        topic = body[2:2 + topic_len]
+        pos = 2 + topic_len
+        qos = (op >> 1) & 0x03
+        if qos:
+            pid = body[pos:pos + 2]
+            pos += 2
+            if qos == 1:
+                await self._send(bytes([_PUBACK, 2]) + pid)
+        if self.cb:
+            self.cb(topic, body[pos:])
+
+    async def _retry_loop(self):
+        while self.connected:
+            now = time.ticks_ms()
+            for entry in list(self._inflight.values()):
+                if time.ticks_diff(now, entry[1]) >= self.ack_timeout_ms:
+                    try:
+                        await self._resend(entry)
+                    except Exception:
+                        return
+            await asyncio.sleep_ms(self.ack_timeout_ms // 4)
+
+    async def _keepalive_loop(self):
+        interval = self.keepalive * 500
+        while self.connected:
+            idle = time.ticks_diff(time.ticks_ms(), self._last_tx)
+            if idle >= interval:
+                try:
+                    await self.ping()
+                except Exception:
+                    return
+                idle = 0
+            if time.ticks_diff(time.ticks_ms(), self._last_rx) > self.keepalive * 1500:
+                print('[MQTT] Keepalive timeout')
+                self._close()
+                return
+            await asyncio.sleep_ms(interval - idle)
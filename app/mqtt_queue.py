@@ -0,0 +1,210 @@
+# mqtt_queue.py - คิวขาออกของ MQTTManager ระหว่างออฟไลน์ (store-and-forward)
+# RAM ring ขนาดคงที่ + (ถ้าตั้งไว้) ring file บน flash ที่ยังอยู่หลังรีบูต
+import os
+import struct
+
+# header ของ ring file: slots, slot_size, head, count
+_HEADER = '>HHHH'
+_HEADER_SIZE = 8
+# หัว record ในแต่ละ slot: flags (bit 0 retain, bit 1-2 qos), topic length, msg length
+_RECORD = '>BHH'
+_RECORD_SIZE = 5
+
+
+def _bytes(s):
+    return s.encode() if isinstance(s, str) else s
+
+
+class FlashRing:
+    """
+    Fixed-size ring of messages in one preallocated file: slots * slot_size bytes plus
+    an 8-byte header, so flash use never grows. A full ring overwrites its oldest
+    message, messages larger than a slot are refused; both count as dropped.
+    The parent directory is created if missing. If the file still cannot be created
+    the ring is disabled: the queue runs RAM-only and spilled messages count as dropped.
+    """
+
+    def __init__(self, path, slots=32, slot_size=256):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+        self.disabled = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                slots, slot_size, head, count = struct.unpack(_HEADER, f.read(_HEADER_SIZE))
+            if slots == self.slots and slot_size == self.slot_size and head < slots and count <= slots:
+                self.head = head
+                self.count = count
+                return
+        except (OSError, ValueError):
+            pass
+        self._create()
+
+    def _create(self):
+        self.head = self.count = 0
+        try:
+            parent = self.path.rpartition('/')[0]
+            if parent:
+                try:
+                    os.mkdir(parent)
+                except OSError as e:
+                    if e.args[0] != 17:  # EEXIST
+                        raise
+            with open(self.path, 'wb') as f:
+                self._write_header(f)
+                zero = bytes(self.slot_size)
+                for _ in range(self.slots):
+                    f.write(zero)
+        except OSError as e:
+            # flash เต็ม / path ใช้ไม่ได้: ไม่ให้ MQTTManager พังตอนสร้าง ใช้แค่ RAM แทน
+            print('[MQTT] Spill file unavailable, RAM only:', e)
+            self.disabled = True
+
+    def _write_header(self, f):
+        f.seek(0)
+        f.write(struct.pack(_HEADER, self.slots, self.slot_size, self.head, self.count))
+
+    def push(self, topic, msg, retain=False, qos=0):
+        if self.disabled or _RECORD_SIZE + len(topic) + len(msg) > self.slot_size:
+            self.dropped += 1
+            return False
+        try:
+            with open(self.path, 'r+b') as f:
+                if self.count == self.slots:
+                    self.head = (self.head + 1) % self.slots
+                    self.count -= 1
+                    self.dropped += 1
+                f.seek(_HEADER_SIZE + (self.head + self.count) % self.slots * self.slot_size)
+                f.write(struct.pack(_RECORD, (1 if retain else 0) | qos << 1, len(topic), len(msg)))
+                f.write(topic)
+                f.write(msg)
+                self.count += 1
+                self._write_header(f)
+            return True
+        except OSError as e:
+            print('[MQTT] Spill write failed:', e)
+            self.dropped += 1
+            return False
+
+    def peek(self):
+        if not self.count:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(_HEADER_SIZE + self.head * self.slot_size)
+            flags, topic_len, msg_len = struct.unpack(_RECORD, f.read(_RECORD_SIZE))
+            topic = f.read(topic_len)
+            return topic, f.read(msg_len), bool(flags & 1), flags >> 1
+
+    def pop(self):
+        if not self.count:
+            return
+        self.head = (self.head + 1) % self.slots
+        self.count -= 1
+        with open(self.path, 'r+b') as f:
+            self._write_header(f)
+
+
+class MessageQueue:
+    """
+    Bounded outbound queue: a ring of `size` messages holding at most `max_bytes` of
+    topic + payload in RAM. Retained messages are coalesced per topic (a new retained
+    status/health replaces the queued one in place). When RAM is full the oldest message
+    moves to `spill` (a FlashRing) if given, otherwise it is dropped.
+    Messages come out oldest first: spilled ones, then RAM.
+    """
+
+    def __init__(self, size=16, max_bytes=4096, spill=None):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.spill = spill
+        self._topics = [None] * size
+        self._msgs = [None] * size
+        self._flags = bytearray(size)
+        self._head = 0
+        self._count = 0
+        self._bytes = 0
+        # topic -> slot ของ retained message ที่ยังรออยู่ใน RAM
+        self._latest = {}
+        self.dropped = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return self._count + (self.spill.count if self.spill else 0)
+
+    def stats(self):
+        return {
+            'queued': len(self),
+            'ram_bytes': self._bytes,
+            'dropped': self.dropped + (self.spill.dropped if self.spill else 0),
+            'coalesced': self.coalesced,
+            'spill_disabled': bool(self.spill and self.spill.disabled),
+        }
+
+    def push(self, topic, msg, retain=False, qos=0):
+        topic = _bytes(topic)
+        msg = _bytes(msg)
+        n = len(topic) + len(msg)
+        if n > self.max_bytes:
+            self.dropped += 1
+            return
+        i = self._latest.get(topic) if retain else None
+        if i is not None:
+            self._bytes += len(msg) - len(self._msgs[i])
+            self._msgs[i] = msg
+            self._flags[i] = 1 | qos << 1
+            self.coalesced += 1
+        else:
+            while self._count and (self._count == self.size or self._bytes + n > self.max_bytes):
+                self._evict()
+            i = (self._head + self._count) % self.size
+            self._topics[i] = topic
+            self._msgs[i] = msg
+            self._flags[i] = (1 if retain else 0) | qos << 1
+            self._count += 1
+            self._bytes += n
+            if retain:
+                self._latest[topic] = i
+        while self._bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        i = self._head
+        if self.spill is not None:
+            flags = self._flags[i]
+            self.spill.push(self._topics[i], self._msgs[i], flags & 1, flags >> 1)
+        else:
+            self.dropped += 1
+        self._pop_ram()
+
+    def _pop_ram(self):
+        i = self._head
+        topic = self._topics[i]
+        if self._latest.get(topic) == i:
+            del self._latest[topic]
+        self._bytes -= len(topic) + len(self._msgs[i])
+        self._topics[i] = self._msgs[i] = None
+        self._head = (i + 1) % self.size
+        self._count -= 1
+
+    def peek(self):
+        """Oldest message as (topic, msg, retain, qos) without removing it, None when empty."""
+        if self.spill is not None and self.spill.count:
+            return self.spill.peek()
+        if not self._count:
+            return None
+        i = self._head
+        flags = self._flags[i]
+        return self._topics[i], self._msgs[i], bool(flags & 1), flags >> 1
+
+    def pop(self):
+        """Remove the message returned by peek()."""
+        if self.spill is not None and self.spill.count:
+            self.spill.pop()
+        elif self._count:
+            self._pop_ram()
@@ -0,0 +1,62 @@
+# mqtt_router.py - จับคู่ topic ขาเข้ากับ handler ด้วย trie ตามระดับของ topic (รองรับ + และ #)
+
+
+class _Node:
+    __slots__ = ('children', 'handlers')
+
+    def __init__(self):
+        self.children = {}
+        self.handlers = []
+
+
+class TopicRouter:
+    """
+    Prefix trie of MQTT topic filters, one level per node.
+
+    add('esp/+/cmd/ping', handler) registers a handler; match(topic) returns every
+    handler whose filter matches, walking only the levels of the topic (plus the
+    '+' and '#' branches) instead of testing each filter in turn.
+    Wildcards do not match topics starting with '$', as in MQTT.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+
+    def add(self, pattern, handler):
+        node = self._root
+        for level in pattern.split('/'):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = _Node()
+            node = child
+        node.handlers.append(handler)
+
+    def remove(self, pattern, handler):
+        node = self._root
+        for level in pattern.split('/'):
+            node = node.children.get(level)
+            if node is None:
+                return
+        if handler in node.handlers:
+            node.handlers.remove(handler)
+
+    def match(self, topic):
+        out = []
+        levels = topic.split('/')
+        self._match(self._root, levels, 0, out, not topic.startswith('$'))
+        return out
+
+    def _match(self, node, levels, i, out, wild):
+        # '#' ตรงกับระดับที่เหลือทั้งหมด รวมถึงระดับแม่ ('a/#' ตรงกับ 'a')
+        multi = node.children.get('#') if wild else None
+        if multi is not None:
+            out.extend(multi.handlers)
+        if i == len(levels):
+            out.extend(node.handlers)
+            return
+        child = node.children.get(levels[i])
+        if child is not None:
+            self._match(child, levels, i + 1, out, True)
+        single = node.children.get('+') if wild else None
+        if single is not None:
+            self._match(single, levels, i + 1, out, True)
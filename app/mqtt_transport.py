@@ -0,0 +1,154 @@
+# mqtt_transport.py - รับ release สำหรับ OTA ผ่าน MQTT broker แทน GitHub
+# ใช้กับ OTAUpdater(transport=MQTTTransport(mqtt), mqtt=mqtt) สำหรับเครื่องที่ออกเน็ตไม่ได้แต่เห็น broker ในวง LAN
+import time
+import struct
+import ujson
+import uasyncio as asyncio
+
+# file index (2 bytes) + chunk number (4 bytes), big endian
+CHUNK_HEADER = '>HI'
+CHUNK_HEADER_SIZE = 6
+
+
+class _Received:
+    # หน้าตาเหมือน Response ของ HttpClient เท่าที่ OTAUpdater._verify_download ใช้
+    status_code = 200
+    reason = 'OK'
+
+    def __init__(self, bytes_read, elapsed_ms):
+        self.bytes_read = bytes_read
+        self.elapsed_ms = elapsed_ms
+
+
+class MQTTTransport:
+    """
+    OTA release source through the app's MQTTManager connection (async only).
+
+    Subscriptions go through MQTTManager.subscribe(), so manifest and chunks arrive on
+    the same AsyncMQTTClient and TopicRouter as commands; the session's keepalive,
+    reconnect and resubscribe cover OTA too. Use OTAUpdater.install_update_if_available_async().
+
+    Topics, <ota> = esp/<device_id>/ota (or esp/all/ota for a manifest sent to the whole fleet):
+    - <ota>/manifest  retained JSON {"version", "chunk_size", "files": [{path, size, sha, sha256}]}
+    - <ota>/chunk     2-byte file index + 4-byte chunk number (big endian) followed by the data
+    - esp/<device_id>/ota/ack  JSON {"version", "file", "path", "next", "window"} from the device
+
+    The subscription stays open, so a manifest published after the first check (a new
+    release) replaces the retained one received at subscribe time.
+
+    Every ack asks the sender for `window` chunks starting at `next`. The device acks again
+    when the window is complete, or re-acks the first missing chunk after timeout_ms (go-back-N).
+    Chunks are written straight to the file and hashed as they arrive; OTAUpdater verifies
+    size and hash against the manifest like it does for GitHub downloads.
+    """
+
+    def __init__(self, mqtt, window=8, timeout_ms=5000, retries=5):
+        self.mqtt = mqtt
+        self.window = window
+        self.timeout_ms = timeout_ms
+        self.retries = retries
+        self.ota_topic = 'esp/{}/ota'.format(mqtt.device_id)
+        self.ack_topic = self.ota_topic + '/ack'
+        self._subscribed = False
+        self._manifest = None
+        self._manifest_event = asyncio.Event()
+        # chunk ที่รอเขียน (None = ไม่ได้ดาวน์โหลดอยู่ ทิ้ง chunk ที่มาถึง)
+        self._chunks = None
+        self._chunk_event = asyncio.Event()
+        self._version = None
+        self._chunk_size = 0
+        self._files = []
+
+    async def _on_manifest(self, topic, msg):
+        self._manifest = msg
+        self._manifest_event.set()
+
+    async def _on_chunk(self, topic, msg):
+        if self._chunks is not None:
+            self._chunks.append(msg)
+            self._chunk_event.set()
+
+    async def _subscribe(self):
+        if self._subscribed:
+            return
+        mqtt = self.mqtt
+        await mqtt.subscribe(self.ota_topic + '/manifest', self._on_manifest)
+        await mqtt.subscribe('esp/all/ota/manifest', self._on_manifest)
+        await mqtt.subscribe(self.ota_topic + '/chunk', self._on_chunk)
+        self._subscribed = True
+
+    async def get_latest_version_async(self):
+        await self._subscribe()
+        if self._manifest is None:
+            # retained manifest มาทันทีหลัง SUBSCRIBE ถ้า broker มี
+            print('Waiting for OTA manifest on', self.ota_topic + '/manifest')
+            try:
+                await asyncio.wait_for_ms(self._manifest_event.wait(), self.timeout_ms)
+            except asyncio.TimeoutError:
+                raise OSError('No OTA manifest from broker')
+        self._manifest_event.clear()
+        manifest = ujson.loads(self._manifest)
+        self._version = manifest['version']
+        self._chunk_size = manifest['chunk_size']
+        self._files = [(f['path'], f.get('sha'), f.get('size'), f.get('sha256')) for f in manifest['files']]
+        print('Latest version from broker: ', self._version)
+        return self._version
+
+    def get_files(self, version):
+        if version != self._version:
+            raise OSError('No manifest for version {}'.format(version))
+        return self._files
+
+    async def _ack(self, version, index, gitPath, next_chunk):
+        # JSON เสมอ (ไม่ตาม encoding ของ MQTTManager): tools/mqtt_ota_send.py อ่าน JSON
+        await self.mqtt.publish(self.ack_topic, ujson.dumps({'version': version, 'file': index, 'path': gitPath, 'next': next_chunk, 'window': self.window}))
+
+    async def download_file_async(self, version, gitPath, path, hasher=None):
+        await self._subscribe()
+        index = 0
+        while self._files[index][0] != gitPath:
+            index += 1
+        size = self._files[index][2] or 0
+        total = (size + self._chunk_size - 1) // self._chunk_size
+        start = time.ticks_ms()
+        received = 0
+        expected = 0
+        window_end = min(self.window, total)
+        retries = 0
+        self._chunks = []
+        self._chunk_event.clear()
+        try:
+            with open(path, 'wb') as f:
+                if total:
+                    await self._ack(version, index, gitPath, 0)
+                while expected < total:
+                    if not self._chunks:
+                        try:
+                            await asyncio.wait_for_ms(self._chunk_event.wait(), self.timeout_ms)
+                        except asyncio.TimeoutError:
+                            retries += 1
+                            if retries > self.retries:
+                                raise OSError('Timed out receiving {} at chunk {}'.format(gitPath, expected))
+                            # ขอใหม่ตั้งแต่ chunk แรกที่ยังไม่ได้
+                            await self._ack(version, index, gitPath, expected)
+                            window_end = min(expected + self.window, total)
+                        self._chunk_event.clear()
+                        continue
+                    chunk = self._chunks.pop(0)
+                    file_index, seq = struct.unpack_from(CHUNK_HEADER, chunk)
+                    if file_index != index or seq != expected:
+                        # ซ้ำ / มาข้าม / ของไฟล์อื่น: ทิ้ง แล้วรอ retransmit
+                        continue
+                    data = memoryview(chunk)[CHUNK_HEADER_SIZE:]
+                    f.write(data)
+                    if hasher is not None:
+                        hasher.update(data)
+                    received += len(data)
+                    expected += 1
+                    retries = 0
+                    if expected == window_end:
+                        await self._ack(version, index, gitPath, expected)
+                        window_end = min(expected + self.window, total)
+        finally:
+            self._chunks = None
+        return _Received(received, time.ticks_diff(time.ticks_ms(), start))
@@ -1,5 +1,49 @@
-import os, gc
+import os, gc, time
+import ubinascii
+try:
+    import hashlib
+except ImportError:
+    try:
+        import uhashlib as hashlib
+    except ImportError:
+        hashlib = None
 from .httpclient import HttpClient
+from .jsonstream import JsonStream
+
+# รายการไฟล์ที่ติดตั้งอยู่ (relative path -> git blob sha) เก็บไว้ในโฟลเดอร์เวอร์ชั่นเดียวกับโค้ด
+MANIFEST_FILE = '.manifest'
+# ไฟล์ pointer บอกว่า slot ไหน active (boot.py อ่านไฟล์นี้ก่อน import main)
+SLOT_FILE = '/config/ota_slot'
+# repo / token / ตั้งค่าการเช็คอัปเดต ใช้ร่วมกันระหว่าง boot.py, main.py และ portal
+GITHUB_CONFIG = '/config/github.json'
+# body JSON ของ path async พักไว้บน flash ก่อน parse (ดู OTAUpdater._parse_json_async)
+JSON_SPOOL = '.ota_response.json'
+
+
+def _load_json(path):
+    if not path:
+        return {}
+    try:
+        import ujson
+        with open(path) as f:
+            return ujson.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def read_active_slot(slot_file=SLOT_FILE):
+    """Return the slot directory named by the pointer file, or None on the legacy single-folder layout."""
+    # .tmp มีแค่ตอนไฟดับระหว่างลบ pointer เก่ากับ rename ตัวใหม่ (filesystem ที่ rename ทับไม่ได้)
+    for path in (slot_file, slot_file + '.tmp'):
+        try:
+            with open(path) as f:
+                slot = f.read().strip()
+            if slot:
+                return slot
+        except OSError:
+            pass
+    return None
+
 
 class OTAUpdater:
     """
@@ -7,18 +51,107 @@ class OTAUpdater:
     optimized for low power usage.
     """
 
-    def __init__(self, github_repo, github_src_dir='', module='', main_dir='main', new_version_dir='next', secrets_file=None, headers={}):
-        self.http_client = HttpClient(headers=headers)
+    def __init__(self, github_repo, github_src_dir='', module='', main_dir='main', new_version_dir='next', secrets_file=None, headers={}, keep_alive=False, buffer_size=1024, cache_file='/config/ota_cache.json', manifest_file='manifest.json', archive_name=None, slots=('slot_a', 'slot_b'), slot_file=SLOT_FILE, caps_file='/config/ota_caps.json', state_file='/config/ota_state.json', check_ttl=6 * 3600, check_jitter=600, transport=None, api_url='https://api.github.com', raw_url='https://raw.githubusercontent.com', mqtt=None):
+        self.http_client = HttpClient(headers=headers, keep_alive=keep_alive, buffer_size=buffer_size)
+        self.headers = headers
+        self.buffer_size = buffer_size
         self.github_repo = github_repo.rstrip('/').replace('https://github.com/', '')
         self.github_src_dir = '' if len(github_src_dir) < 1 else github_src_dir.rstrip('/') + '/'
         self.module = module.rstrip('/')
         self.main_dir = main_dir
         self.new_version_dir = new_version_dir
         self.secrets_file = secrets_file
+        self.cache_file = cache_file
+        self.manifest_file = manifest_file
+        # ชื่อ release asset (.tar / .tar.gz ของโฟลเดอร์ main) ถ้าตั้งไว้จะติดตั้งจาก archive ก้อนเดียว
+        self.archive_name = archive_name
+        # A/B slots: ดาวน์โหลดลง slot ที่ไม่ active แล้วสลับ pointer ทีเดียว (main_dir ยังเป็นชื่อโฟลเดอร์ฝั่งรีโป)
+        self.slots = slots
+        self.slot_file = slot_file
+        self.caps_file = caps_file
+        # เช็คอัปเดตไม่บ่อยกว่า check_ttl วินาที + สุ่มเพิ่มไม่เกิน check_jitter ไม่ให้ทุกเครื่องยิง GitHub พร้อมกัน
+        self.state_file = state_file
+        self.check_ttl = check_ttl
+        self.check_jitter = check_jitter
+        # แหล่งของ release: ค่าเริ่มต้นคือ GitHub (ตัว OTAUpdater เอง) หรือ object อื่นที่มี get_latest_version_async() /
+        # get_files(version) / download_file_async(version, gitPath, path, hasher) เช่น MQTTTransport (ใช้ได้เฉพาะ *_async)
+        self.transport = transport or self
+        # MQTTManager ของแอป: ประกาศเวอร์ชั่นหลัง OTA ผ่าน session เดิม (None = ไม่ประกาศ, client id ซ้ำจะเตะ session หลักหลุด)
+        self.mqtt = mqtt
+        # เปลี่ยนเป็น mirror ในวง LAN ได้ (tools/ota_mirror.py) เช่น api_url='http://192.168.1.10:8080', raw_url=api_url + '/raw'
+        self.api_url = api_url.rstrip('/')
+        self.raw_url = raw_url.rstrip('/')
+        self._active = None
+        self._staging = None
+        self._downloaded_bytes = 0
+        self._download_ms = 0
+        self._installed_files = {}
+        self._new_files = {}
+        self._unchanged_files = []
+        self._created_dirs = set()
 
     def __del__(self):
         self.http_client = None
 
+    @classmethod
+    def from_config(cls, default_repo, config_file=GITHUB_CONFIG, **kwargs):
+        """Create an updater from the shared GitHub config file.
+
+        Reads github_repo, github_token, ota_ttl_sec, ota_jitter_sec and ota_mirror_url from
+        config_file; keyword arguments are passed to the constructor and win over the file.
+        """
+        config = _load_json(config_file)
+        if not config:
+            print('[OTA] No GitHub config found, using default settings')
+        headers = {
+            b'Accept': b'application/vnd.github+json',
+            b'X-GitHub-Api-Version': b'2022-11-28',
+        }
+        token = config.get('github_token')
+        if token:
+            headers[b'Authorization'] = b'Bearer ' + token.encode()
+            print('[OTA] Using GitHub token authentication')
+        else:
+            print('[OTA] Warning: No GitHub token - private repos will not work')
+        kwargs.setdefault('github_repo', config.get('github_repo') or default_repo)
+        kwargs.setdefault('headers', headers)
+        if 'ota_ttl_sec' in config:
+            kwargs.setdefault('check_ttl', config['ota_ttl_sec'])
+        if 'ota_jitter_sec' in config:
+            kwargs.setdefault('check_jitter', config['ota_jitter_sec'])
+        mirror = config.get('ota_mirror_url')
+        if mirror:
+            print('[OTA] Using mirror', mirror)
+            kwargs.setdefault('api_url', mirror)
+            kwargs.setdefault('raw_url', mirror.rstrip('/') + '/raw')
+        return cls(**kwargs)
+
+    def seconds_until_check(self) -> int:
+        """Seconds to wait before the next update check, from the persisted last-check time, TTL and jitter."""
+        if self._exists_file(self.modulepath(self.new_version_dir + '/.version')):
+            # มีเวอร์ชั่นที่รอติดตั้งอยู่ (จาก check_for_update_to_install_during_next_reboot หรือติดตั้งค้าง)
+            return 0
+        last = _load_json(self.state_file).get('last_check', 0)
+        wait = last + self.check_ttl - time.time()
+        if wait < 0 or wait > self.check_ttl:
+            # ถึงเวลาแล้ว หรือนาฬิกาถอยหลัง (ยังไม่ได้ sync NTP) ก็ถือว่าถึงเวลา
+            wait = 0
+        if self.check_jitter:
+            import random
+            wait += random.randint(0, self.check_jitter)
+        return int(wait)
+
+    def _mark_checked(self):
+        if not self.state_file:
+            return
+        try:
+            import ujson
+            self._mk_file_dir(self.state_file)
+            with open(self.state_file, 'w') as f:
+                ujson.dump({'last_check': time.time()}, f)
+        except OSError as e:
+            print('Could not save OTA state: ', e)
+
     def check_for_update_to_install_during_next_reboot(self) -> bool:
         """Function which will check the GitHub repo if there is a newer version available.
         
@@ -33,6 +166,10 @@ class OTAUpdater:
             bool: true if a new version is available, false otherwise
         """
         
+        if self.transport is not self:
+            print('OTA transport is async only, use the *_async methods')
+            return False
+
         # Check if SSL is available (required for GitHub API)
         try:
             import ussl
@@ -92,6 +229,10 @@ class OTAUpdater:
             bool: true if a new version is available, false otherwise
         """
         
+        if self.transport is not self:
+            print('OTA transport is async only, use the *_async methods')
+            return False
+
         # Check if SSL is available (required for GitHub API)
         try:
             import ussl
@@ -99,23 +240,94 @@ class OTAUpdater:
             print('SSL not available, OTA updates disabled')
             return False
 
+        self.http_client.reset_stats()
+        self._downloaded_bytes = 0
+        self._download_ms = 0
         try:
             (current_version, latest_version) = self._check_for_new_version()
             if self._compare_versions(current_version, latest_version):
                 print('Updating to version {}...'.format(latest_version))
                 self._create_new_version_file(latest_version)
+                self._prepare_staging()
                 self._download_new_version(latest_version)
                 self._copy_secrets_file()
-                self._delete_old_version()
-                self._install_new_version()
+                self._carry_over_unchanged_files()
+                self._switch_slot(latest_version)
                 return True
         except Exception as e:
             print('OTA update failed:', e)
             return False
+        finally:
+            stats = self.http_client.stats
+            print('Connections opened: {}, reused: {}, DNS lookups: {}'.format(stats['opened'], stats['reused'], stats['resolved']))
+            if self._download_ms:
+                print('Downloaded {} bytes in {} ms ({} B/s)'.format(self._downloaded_bytes, self._download_ms, self._downloaded_bytes * 1000 // self._download_ms))
+            self.http_client.close()
         
         return False
 
 
+    async def check_for_update_to_install_during_next_reboot_async(self) -> bool:
+        """Same as check_for_update_to_install_during_next_reboot, without blocking the uasyncio loop."""
+        try:
+            current_version = self.current_version()
+            if self.transport is self:
+                latest_version = await self.get_latest_version_async()
+            else:
+                latest_version = await self.transport.get_latest_version_async()
+            if self._compare_versions(current_version, latest_version):
+                print('New version available, will download and install on next reboot')
+                self._create_new_version_file(latest_version)
+                return True
+        except Exception as e:
+            print('OTA check failed:', e)
+        return False
+
+    async def install_update_if_available_async(self, concurrency=2) -> bool:
+        """Same as install_update_if_available, without blocking the uasyncio loop.
+
+        Files are downloaded by `concurrency` workers, each on its own connection, so
+        TLS handshakes and network waits overlap with flash writes while other tasks
+        (LED, watchdog, MQTT) keep running. Every TLS connection costs tens of KB of RAM,
+        keep concurrency at 2-3. Other transports (MQTTTransport) receive one file at a time.
+
+        Returns
+        -------
+            bool: true if a new version was installed, false otherwise
+        """
+        client = None
+        if self.transport is self:
+            from .async_httpclient import AsyncHttpClient
+            client = AsyncHttpClient(headers=self.headers)
+        self._downloaded_bytes = 0
+        self._download_ms = 0
+        start = time.ticks_ms()
+        try:
+            current_version = self.current_version()
+            if client is None:
+                latest_version = await self.transport.get_latest_version_async()
+            else:
+                latest_version = await self.get_latest_version_async(client)
+            if self._compare_versions(current_version, latest_version):
+                print('Updating to version {}...'.format(latest_version))
+                self._create_new_version_file(latest_version)
+                self._prepare_staging()
+                if client is None:
+                    await self._download_from_transport_async(latest_version)
+                else:
+                    await self._download_new_version_async(client, latest_version, concurrency)
+                self._copy_secrets_file()
+                self._carry_over_unchanged_files()
+                self._switch_slot(latest_version)
+                return True
+        except Exception as e:
+            print('OTA update failed:', e)
+            return False
+        finally:
+            print('OTA run took {} ms, downloaded {} bytes'.format(time.ticks_diff(time.ticks_ms(), start), self._downloaded_bytes))
+
+        return False
+
     @staticmethod
     def _using_network(ssid, password):
         import network
@@ -129,7 +341,7 @@ class OTAUpdater:
         print('network config:', sta_if.ifconfig())
 
     def _check_for_new_version(self):
-        current_version = self.get_version(self.modulepath(self.main_dir))
+        current_version = self.current_version()
         latest_version = self.get_latest_version()
 
         print('Checking version... ')
@@ -181,6 +393,17 @@ class OTAUpdater:
             versionfile.write(latest_version)
             versionfile.close()
 
+    def active_dir(self):
+        """Return the directory (relative to module) that holds the running version."""
+        slot = read_active_slot(self.slot_file)
+        if slot in self.slots and self._exists_dir(self.modulepath(slot)):
+            return slot
+        # ยังไม่เคยติดตั้งแบบ slot: ใช้โฟลเดอร์เดิม
+        return self.main_dir
+
+    def current_version(self):
+        return self.get_version(self.modulepath(self.active_dir()))
+
     def get_version(self, directory, version_file_name='.version'):
         try:
             if version_file_name in os.listdir(directory):
@@ -195,88 +418,580 @@ class OTAUpdater:
     def get_latest_version(self):
         print('Fetching latest version from GitHub...')
         try:
-            latest_release = self.http_client.get('https://api.github.com/repos/{}/releases/latest'.format(self.github_repo))
-            response_data = latest_release.json()
-            version = response_data['tag_name']
-            latest_release.close()
-            print('Successfully fetched latest version: ', version)
-            return version
+            # conditional GET: ถ้า release ไม่เปลี่ยน GitHub ตอบ 304 ไม่มี body และไม่นับ rate limit
+            cache = self._load_release_cache()
+            latest_release = self.http_client.get(self._latest_release_url(), headers=self._release_cache_headers(cache))
+            try:
+                return self._parse_latest_release(latest_release, latest_release, cache)
+            finally:
+                latest_release.close()
         except Exception as e:
             print('Error fetching latest version: ', e)
             raise
 
+    async def get_latest_version_async(self, client=None):
+        if client is None:
+            from .async_httpclient import AsyncHttpClient
+            client = AsyncHttpClient(headers=self.headers)
+        print('Fetching latest version from GitHub...')
+        cache = self._load_release_cache()
+        response = await client.get(self._latest_release_url(), headers=self._release_cache_headers(cache))
+        if response.status_code != 200:
+            # 304 ไม่มี body
+            await response.close()
+            return self._parse_latest_release(response, None, cache)
+        return await self._parse_json_async(response, lambda f: self._parse_latest_release(response, f, cache))
+
+    def _latest_release_url(self):
+        return '{}/repos/{}/releases/latest'.format(self.api_url, self.github_repo)
+
+    def _contents_url(self, version, sub_dir):
+        return '{}/repos/{}/contents/{}{}{}?ref=refs/tags/{}'.format(self.api_url, self.github_repo, self.github_src_dir, self.main_dir, sub_dir, version)
+
+    def _raw_url(self, version, gitPath):
+        return '{}/{}/{}/{}'.format(self.raw_url, self.github_repo, version, gitPath)
+
+    def _release_cache_headers(self, cache):
+        headers = {}
+        if cache.get('etag'):
+            headers['If-None-Match'] = cache['etag']
+        if cache.get('last_modified'):
+            headers['If-Modified-Since'] = cache['last_modified']
+        return headers
+
+    def _parse_latest_release(self, response, stream, cache):
+        if response.status_code == 304 and cache.get('tag_name'):
+            print('Latest version not modified: ', cache['tag_name'])
+            self._mark_checked()
+            return cache['tag_name']
+        if response.status_code != 200:
+            raise OSError('GitHub returned {} {}'.format(response.status_code, response.reason))
+        self._mark_checked()
+        # อ่านแค่ tag_name ข้าม release notes/assets โดยไม่สร้าง object
+        version = JsonStream(stream).pick(('tag_name',))['tag_name']
+        self._save_release_cache(response.headers.get('etag'), response.headers.get('last-modified'), version)
+        print('Successfully fetched latest version: ', version)
+        return version
+
+    def _load_release_cache(self):
+        return _load_json(self.cache_file)
+
+    def _save_release_cache(self, etag, last_modified, tag_name):
+        if not self.cache_file or not (etag or last_modified):
+            return
+        try:
+            import ujson
+            self._mk_file_dir(self.cache_file)
+            with open(self.cache_file, 'w') as f:
+                ujson.dump({'etag': etag, 'last_modified': last_modified, 'tag_name': tag_name}, f)
+        except OSError as e:
+            print('Could not save release cache: ', e)
+
     def _download_new_version(self, version):
         print('Downloading version {}'.format(version))
-        self._download_all_files(version)
-        print('Version {} downloaded to {}'.format(version, self.modulepath(self.new_version_dir)))
+        if self.archive_name:
+            self._download_archive(version)
+            return
+        # วางแผนทั้งหมดก่อน (รายการไฟล์ + sha + size) แล้วค่อยดาวน์โหลดรอบเดียว
+        files = self.get_files(version)
+        gc.collect()
+        to_download = self._plan_download(files)
+        files = None
 
-    def _download_all_files(self, version, sub_dir=''):
-        url = 'https://api.github.com/repos/{}/contents{}{}{}?ref=refs/tags/{}'.format(self.github_repo, self.github_src_dir, self.main_dir, sub_dir, version)
-        gc.collect() 
-        file_list = self.http_client.get(url)
-        for file in file_list.json():
-            path = self.modulepath(self.new_version_dir + '/' + file['path'].replace(self.main_dir + '/', '').replace(self.github_src_dir, ''))
-            if file['type'] == 'file':
-                gitPath = file['path']
+        for gitPath, relPath, sha, size, sha256 in to_download:
+            path = self.modulepath(self._staging + '/' + relPath)
+            self._mk_parent_dirs(path)
+            print('\tDownloading: ', gitPath, 'to', path)
+            self._download_file(version, gitPath, path, sha, size, sha256)
+            gc.collect()
+        self._write_manifest(self.modulepath(self._staging), self._new_files)
+        print('Version {} downloaded to {}'.format(version, self.modulepath(self._staging)))
+
+    async def _download_new_version_async(self, client, version, concurrency):
+        import uasyncio as asyncio
+        print('Downloading version {}'.format(version))
+        if self.archive_name:
+            # archive เป็น stream เดียวอยู่แล้ว ไม่มีอะไรให้ทำพร้อมกัน
+            await self._download_archive_async(client, version)
+            return
+        files = await self._get_files_async(client, version)
+        gc.collect()
+        queue = self._plan_download(files)
+        files = None
+        errors = []
+
+        async def worker():
+            # แต่ละ worker มี buffer และ connection ของตัวเอง
+            buffer = bytearray(self.buffer_size)
+            while queue and not errors:
+                gitPath, relPath, sha, size, sha256 = queue.pop(0)
+                path = self.modulepath(self._staging + '/' + relPath)
+                self._mk_parent_dirs(path)
                 print('\tDownloading: ', gitPath, 'to', path)
-                self._download_file(version, gitPath, path)
-            elif file['type'] == 'dir':
-                print('Creating dir', path)
-                self.mkdir(path)
-                self._download_all_files(version, sub_dir + '/' + file['name'])
+                try:
+                    hasher, expected = self._file_hasher(sha, size, sha256)
+                    response = await client.get(self._raw_url(version, gitPath))
+                    await response.save(path, buffer, hasher)
+                    self._verify_download(gitPath, response, size, hasher, expected)
+                except Exception as e:
+                    errors.append(e)
+
+        await asyncio.gather(*[worker() for _ in range(max(1, min(concurrency, len(queue))))])
+        if errors:
+            raise errors[0]
+        self._write_manifest(self.modulepath(self._staging), self._new_files)
+        print('Version {} downloaded to {}'.format(version, self.modulepath(self._staging)))
+
+    async def _download_from_transport_async(self, version):
+        # transport อื่น (เช่น MQTT) ส่งทีละไฟล์ผ่าน connection เดียว: ไม่มี worker พร้อมกัน
+        files = self.transport.get_files(version)
+        gc.collect()
+        to_download = self._plan_download(files)
+        files = None
+
+        for gitPath, relPath, sha, size, sha256 in to_download:
+            path = self.modulepath(self._staging + '/' + relPath)
+            self._mk_parent_dirs(path)
+            print('\tDownloading: ', gitPath, 'to', path)
+            hasher, expected = self._file_hasher(sha, size, sha256)
+            response = await self.transport.download_file_async(version, gitPath, path, hasher)
+            self._verify_download(gitPath, response, size, hasher, expected)
             gc.collect()
+        self._write_manifest(self.modulepath(self._staging), self._new_files)
+        print('Version {} downloaded to {}'.format(version, self.modulepath(self._staging)))
 
-        file_list.close()
+    async def _get_files_async(self, client, version):
+        if self.manifest_file:
+            response = await client.get(self._manifest_url(version))
+            if response.status_code == 200:
+                files = await self._parse_json_async(response, self._parse_release_manifest)
+                if files is not None:
+                    return files
+            else:
+                await response.close()
+                print('No release manifest ({}), listing files via contents API'.format(response.status_code))
+        files = []
+        await self._list_all_files_async(client, version, '', files)
+        return files
+
+    async def _list_all_files_async(self, client, version, sub_dir, files):
+        gc.collect()
+        file_list = await client.get(self._contents_url(version, sub_dir))
+        if file_list.status_code != 200:
+            await file_list.close()
+            raise OSError('Cannot list {}{}: {} {}'.format(self.main_dir, sub_dir, file_list.status_code, file_list.reason))
+        entries = await self._parse_json_async(file_list, self._parse_contents)
+        for gitPath, file_type, name, sha, size in entries:
+            if file_type == 'file':
+                files.append((gitPath, sha, size, None))
+            elif file_type == 'dir':
+                await self._list_all_files_async(client, version, sub_dir + '/' + name, files)
+
+    def _plan_download(self, files):
+        """Split [(gitPath, sha, size, sha256)] into files to download and files to carry over.
+
+        Returns [(gitPath, relPath, sha, size, sha256)] of the files to download.
+        """
+        # delta OTA: ไฟล์ที่ blob sha ไม่เปลี่ยนจะไม่ดาวน์โหลดใหม่ แต่ copy จาก slot ที่ active มาทีหลัง
+        self._installed_files = self._read_manifest(self.modulepath(self._active))
+        self._new_files = {}
+        self._unchanged_files = []
+        self._created_dirs = set()
+        to_download = []
+        sizes = []
+        for gitPath, sha, size, sha256 in files:
+            relPath = self._rel_path(gitPath)
+            self._new_files[relPath] = sha
+            sizes.append(size)
+            if sha and self._installed_files.get(relPath) == sha and self._exists_file(self.modulepath(self._active + '/' + relPath)):
+                print('\tUnchanged: ', gitPath)
+                self._unchanged_files.append(relPath)
+            else:
+                to_download.append((gitPath, relPath, sha, size, sha256))
+        removed = [f for f in self._installed_files if f not in self._new_files]
+        print('Changed: {}, unchanged: {}, removed: {}'.format(len(to_download), len(self._unchanged_files), len(removed)))
+
+        # ไฟล์ที่ไม่เปลี่ยนก็ต้อง copy ลง slot ใหม่ด้วย จึงนับทุกไฟล์
+        self._check_free_space(sizes)
+        return to_download
+
+    def _rel_path(self, gitPath):
+        return gitPath.replace(self.main_dir + '/', '').replace(self.github_src_dir, '')
+
+    def _download_archive(self, version):
+        from . import untar
+        # รายการไฟล์ + sha ที่คาดไว้ (manifest หรือ contents API) ใช้ตรวจทุกไฟล์ที่แตกออกมา
+        files = self.get_files(version)
+        asset_url = self._find_release_asset(version, self.archive_name)
+        # API asset URL + Accept octet-stream -> 302 ไปที่ storage ของ GitHub (HttpClient ตาม redirect ให้)
+        response = self.http_client.get(asset_url, headers={'Accept': 'application/octet-stream'})
+        try:
+            if response.status_code != 200:
+                raise OSError('Cannot download {}: {} {}'.format(self.archive_name, response.status_code, response.reason))
+            stream = response
+            if self.archive_name.endswith('.gz') or self.archive_name.endswith('.z'):
+                stream = untar.decompressor(response, gzip=self.archive_name.endswith('.gz'))
+            self._check_free_space([f[2] for f in files])
+            start = time.ticks_ms()
+            self._new_files = untar.extract(stream, self.modulepath(self._staging), self.github_src_dir + self.main_dir + '/')
+            self._download_ms += time.ticks_diff(time.ticks_ms(), start)
+            self._downloaded_bytes += response.bytes_read
+        finally:
+            response.close()
+        self._finish_archive(version, files)
+
+    async def _download_archive_async(self, client, version):
+        import uasyncio as asyncio
+        from . import untar
+        files = await self._get_files_async(client, version)
+        asset_url = await self._find_release_asset_async(client, version, self.archive_name)
+        response = await client.get(asset_url, headers={'Accept': 'application/octet-stream'})
+        if response.status_code != 200:
+            await response.close()
+            raise OSError('Cannot download {}: {} {}'.format(self.archive_name, response.status_code, response.reason))
+        # decompressor ของ firmware อ่านจาก stream แบบ blocking: ดาวน์โหลด asset ลง flash แบบ async ก่อน
+        # แล้วค่อยแตกจากไฟล์ทีละ block โดยคืน loop ให้ task อื่นระหว่าง block
+        tmp = self.modulepath(self.new_version_dir + '/' + self.archive_name)
+        self._check_free_space([f[2] for f in files] + [int(response.headers.get('content-length', 0))])
+        await response.save(tmp, bytearray(self.buffer_size))
+        self._downloaded_bytes += response.bytes_read
+        self._download_ms += response.elapsed_ms
+        self._new_files = {}
+        try:
+            with open(tmp, 'rb') as f:
+                stream = f
+                if self.archive_name.endswith('.gz') or self.archive_name.endswith('.z'):
+                    stream = untar.decompressor(f, gzip=self.archive_name.endswith('.gz'))
+                for _ in untar.iter_extract(stream, self.modulepath(self._staging), self.github_src_dir + self.main_dir + '/', self._new_files):
+                    await asyncio.sleep_ms(0)
+        finally:
+            os.remove(tmp)
+        self._finish_archive(version, files)
+
+    def _finish_archive(self, version, files):
+        self._verify_archive(files)
+        self._unchanged_files = []
+        self._write_manifest(self.modulepath(self._staging), self._new_files)
+        print('Version {} extracted to {} ({} files)'.format(version, self.modulepath(self._staging), len(self._new_files)))
+
+    def _verify_archive(self, files):
+        """Check the extracted files against [(gitPath, sha, size, sha256)] of the release, before the slot switch."""
+        expected = {}
+        for gitPath, sha, size, sha256 in files:
+            expected[self._rel_path(gitPath)] = (sha, size, sha256)
+        for relPath in self._new_files:
+            if relPath not in expected:
+                raise OSError('Archive has {} which is not in the release'.format(relPath))
+        for relPath, (sha, size, sha256) in expected.items():
+            if relPath not in self._new_files:
+                raise OSError('Archive is missing {}'.format(relPath))
+            got = self._new_files[relPath]
+            if sha and got is not None:
+                # untar คำนวณ git blob sha ระหว่างแตกไฟล์แล้ว ไม่ต้องอ่านซ้ำ
+                if got != sha:
+                    raise OSError('Hash mismatch for {}: got {}, expected {}'.format(relPath, got, sha))
+            elif sha256:
+                # manifest มีแค่ sha256: อ่านไฟล์จาก flash มา hash อีกรอบ
+                self._verify_file(self.modulepath(self._staging + '/' + relPath), relPath, size, sha256)
+
+    def _verify_file(self, path, relPath, size, sha256):
+        hasher, expected = self._file_hasher(None, size, sha256)
+        if hasher is None:
+            return
+        buf = bytearray(self.buffer_size)
+        mv = memoryview(buf)
+        total = 0
+        with open(path, 'rb') as f:
+            n = f.readinto(buf)
+            while n:
+                hasher.update(buf if n == len(buf) else mv[:n])
+                total += n
+                n = f.readinto(buf)
+        if size is not None and total != size:
+            raise OSError('Size mismatch for {}: got {} bytes, expected {}'.format(relPath, total, size))
+        digest = ubinascii.hexlify(hasher.digest()).decode()
+        if digest != expected:
+            raise OSError('Hash mismatch for {}: got {}, expected {}'.format(relPath, digest, expected))
+
+    def _release_url(self, version):
+        return '{}/repos/{}/releases/tags/{}'.format(self.api_url, self.github_repo, version)
+
+    def _find_release_asset(self, version, name):
+        response = self.http_client.get(self._release_url(version))
+        try:
+            if response.status_code != 200:
+                raise OSError('Cannot read release {}: {} {}'.format(version, response.status_code, response.reason))
+            return self._parse_release_asset(response, version, name)
+        finally:
+            response.close()
+
+    async def _find_release_asset_async(self, client, version, name):
+        response = await client.get(self._release_url(version))
+        if response.status_code != 200:
+            await response.close()
+            raise OSError('Cannot read release {}: {} {}'.format(version, response.status_code, response.reason))
+        return await self._parse_json_async(response, self._parse_release_asset, version, name)
+
+    async def _parse_json_async(self, response, parse, *args):
+        """Spool the body to flash through the download buffer, then run parse(file, *args) on it."""
+        # JsonStream อ่านแบบ blocking ผ่าน readinto() ใช้กับ async stream ตรง ๆ ไม่ได้
+        # เขียนลงไฟล์ทีละ buffer แทนการ read() ทั้ง body เข้า RAM
+        tmp = self.modulepath(JSON_SPOOL)
+        await response.save(tmp, bytearray(self.buffer_size))
+        try:
+            with open(tmp, 'rb') as f:
+                return parse(f, *args)
+        finally:
+            os.remove(tmp)
+
+    def _parse_release_asset(self, stream, version, name):
+        stream = JsonStream(stream)
+        if stream.seek('assets'):
+            for asset in stream.items(('name', 'url')):
+                if asset.get('name') == name:
+                    return asset['url']
+        raise OSError('Release {} has no asset {}'.format(version, name))
+
+    def _manifest_url(self, version):
+        return self._raw_url(version, self.github_src_dir + self.manifest_file)
+
+    def _get_release_manifest(self, version):
+        """Return [(gitPath, sha, size, sha256)] from the release manifest file, or None if the release has none."""
+        if not self.manifest_file:
+            return None
+        response = self.http_client.get(self._manifest_url(version))
+        try:
+            if response.status_code != 200:
+                print('No release manifest ({}), listing files via contents API'.format(response.status_code))
+                return None
+            return self._parse_release_manifest(response)
+        finally:
+            response.close()
+
+    def _parse_release_manifest(self, stream):
+        stream = JsonStream(stream)
+        if not stream.seek('files'):
+            return None
+        return [(f['path'], f.get('sha'), f.get('size'), f.get('sha256')) for f in stream.items(('path', 'sha', 'size', 'sha256'))]
+
+    def _parse_contents(self, stream):
+        # เก็บเฉพาะ field ที่ใช้ของแต่ละ entry
+        return [(file['path'], file['type'], file['name'], file.get('sha'), file.get('size')) for file in JsonStream(stream).items(('path', 'type', 'name', 'sha', 'size'))]
+
+    def _list_all_files(self, version, sub_dir, files):
+        gc.collect() 
+        file_list = self.http_client.get(self._contents_url(version, sub_dir))
+        # ปิด connection ก่อนไล่โฟลเดอร์ย่อย
+        try:
+            # 403 (rate limit) / 404 ตอบเป็น JSON object ไม่ใช่ array
+            if file_list.status_code != 200:
+                raise OSError('Cannot list {}{}: {} {}'.format(self.main_dir, sub_dir, file_list.status_code, file_list.reason))
+            entries = self._parse_contents(file_list)
+        finally:
+            file_list.close()
+        for gitPath, file_type, name, sha, size in entries:
+            if file_type == 'file':
+                files.append((gitPath, sha, size, None))
+            elif file_type == 'dir':
+                self._list_all_files(version, sub_dir + '/' + name, files)
+
+    def _check_free_space(self, sizes):
+        # preflight: ถ้าพื้นที่ไม่พอให้หยุดก่อนเขียนอะไรลง flash
+        try:
+            st = os.statvfs(self.modulepath(self._staging))
+        except OSError:
+            return
+        block = st[0] or 1
+        free = block * st[3]
+        # แต่ละไฟล์ใช้เต็ม block + metadata อีก 1 block
+        needed = 0
+        for size in sizes:
+            needed += (((size or 0) + block - 1) // block + 1) * block
+        print('Flash needed: {} bytes, free: {} bytes'.format(needed, free))
+        if needed > free:
+            raise OSError('Not enough free flash: need {} bytes, {} free'.format(needed, free))
+
+    def _mk_parent_dirs(self, path):
+        parent = path.rpartition('/')[0]
+        if parent and parent not in self._created_dirs:
+            self._mk_dirs(parent)
+            self._created_dirs.add(parent)
+
+    def _download_file(self, version, gitPath, path, sha=None, size=None, sha256=None):
+        hasher, expected = self._file_hasher(sha, size, sha256)
+        response = self.download_file(version, gitPath, path, hasher)
+        self._verify_download(gitPath, response, size, hasher, expected)
 
-    def _download_file(self, version, gitPath, path):
-        self.http_client.get('https://raw.githubusercontent.com/{}/{}/{}'.format(self.github_repo, version, gitPath), saveToFile=path)
+    def get_files(self, version):
+        """Return [(gitPath, sha, size, sha256)] of a release, from its manifest or the contents API."""
+        files = self._get_release_manifest(version)
+        if files is None:
+            files = []
+            self._list_all_files(version, '', files)
+        return files
+
+    def download_file(self, version, gitPath, path, hasher=None):
+        """Save one file of a release to path, returns the response (status_code, bytes_read, elapsed_ms)."""
+        return self.http_client.get(self._raw_url(version, gitPath), saveToFile=path, hasher=hasher)
+
+    def _verify_download(self, gitPath, response, size, hasher, expected):
+        self._downloaded_bytes += response.bytes_read
+        self._download_ms += response.elapsed_ms
+        print('\t\t{} bytes in {} ms'.format(response.bytes_read, response.elapsed_ms), getattr(response, 'timings', ''))
+        # ตรวจก่อนสลับ slot: ไฟล์เสียจะไม่ถูกติดตั้ง
+        if response.status_code != 200:
+            raise OSError('Download of {} failed: {} {}'.format(gitPath, response.status_code, response.reason))
+        if size is not None and response.bytes_read != size:
+            raise OSError('Size mismatch for {}: got {} bytes, expected {}'.format(gitPath, response.bytes_read, size))
+        if hasher is not None:
+            digest = ubinascii.hexlify(hasher.digest()).decode()
+            if digest != expected:
+                raise OSError('Hash mismatch for {}: got {}, expected {}'.format(gitPath, digest, expected))
+
+    def _file_hasher(self, sha, size, sha256):
+        """Return (hasher, expected hex digest) for verifying a download while it streams."""
+        if hashlib is None:
+            return None, None
+        if sha256:
+            return hashlib.sha256(), sha256
+        if sha and size is not None:
+            # git blob sha1 = sha1('blob <len>' + NUL + data)
+            return hashlib.sha1(b'blob %d\0' % size), sha
+        return None, None
+
+    def _read_manifest(self, directory):
+        try:
+            import ujson
+            with open(directory + '/' + MANIFEST_FILE) as f:
+                return ujson.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, directory, files):
+        import ujson
+        with open(directory + '/' + MANIFEST_FILE, 'w') as f:
+            ujson.dump(files, f)
+
+    def _carry_over_unchanged_files(self):
+        # copy ไฟล์ที่ไม่เปลี่ยนจาก slot ที่ active ไป slot ใหม่ (ไม่ย้าย เพื่อให้ slot เดิมยังบูตได้ถ้าต้องถอยกลับ)
+        for relPath in self._unchanged_files:
+            if relPath == '.version' or relPath == self.secrets_file:
+                continue
+            toPath = self.modulepath(self._staging + '/' + relPath)
+            self._mk_parent_dirs(toPath)
+            self._copy_file(self.modulepath(self._active + '/' + relPath), toPath)
+        self._unchanged_files = []
 
     def _copy_secrets_file(self):
         if self.secrets_file:
-            fromPath = self.modulepath(self.main_dir + '/' + self.secrets_file)
-            toPath = self.modulepath(self.new_version_dir + '/' + self.secrets_file)
+            fromPath = self.modulepath(self._active + '/' + self.secrets_file)
+            toPath = self.modulepath(self._staging + '/' + self.secrets_file)
             print('Copying secrets file from {} to {}'.format(fromPath, toPath))
             self._copy_file(fromPath, toPath)
             print('Copied secrets file from {} to {}'.format(fromPath, toPath))
 
-    def _delete_old_version(self):
-        print('Deleting old version at {} ...'.format(self.modulepath(self.main_dir)))
-        self._rmtree(self.modulepath(self.main_dir))
-        print('Deleted old version at {} ...'.format(self.modulepath(self.main_dir)))
+    def _prepare_staging(self):
+        """Pick the inactive slot and empty it for the new version."""
+        self._active = self.active_dir()
+        self._staging = self.slots[1] if self._active == self.slots[0] else self.slots[0]
+        staging = self.modulepath(self._staging)
+        if self._exists_dir(staging):
+            # ของที่ค้างจากการติดตั้งครั้งก่อนที่ไม่สำเร็จ หรือเวอร์ชั่นก่อนหน้า
+            self._rmtree(staging)
+        if self._active != self.main_dir and self._exists_dir(self.modulepath(self.main_dir)):
+            # โฟลเดอร์แบบเดิมไม่ได้ใช้แล้วหลังสลับมาใช้ slot
+            self._rmtree(self.modulepath(self.main_dir))
+        self._mk_dirs(staging)
+        print('Installing into {} (active: {})'.format(staging, self.modulepath(self._active)))
 
-    def _install_new_version(self):
-        print('Installing new version at {} ...'.format(self.modulepath(self.main_dir)))
-        if self._os_supports_rename():
-            os.rename(self.modulepath(self.new_version_dir), self.modulepath(self.main_dir))
-        else:
-            self._copy_directory(self.modulepath(self.new_version_dir), self.modulepath(self.main_dir))
+    def _switch_slot(self, version):
+        """Make the staging slot active: one small pointer write instead of delete + copy."""
+        start = time.ticks_ms()
+        with open(self.modulepath(self._staging + '/.version'), 'w') as f:
+            f.write(version)
+        tmp = self.slot_file + '.tmp'
+        self._mk_file_dir(tmp)
+        with open(tmp, 'w') as f:
+            f.write(self._staging)
+        if not self._rename_replaces():
+            # rename ทับไฟล์เดิมไม่ได้: ลบก่อน ระหว่างนี้ boot.py จะอ่าน .tmp แทน
+            try:
+                os.remove(self.slot_file)
+            except OSError:
+                pass
+        os.rename(tmp, self.slot_file)
+        if self._exists_dir(self.modulepath(self.new_version_dir)):
             self._rmtree(self.modulepath(self.new_version_dir))
-        print('Update installed, please reboot now')
-        
+        print('Switched to {} in {} ms, please reboot now'.format(self.modulepath(self._staging), time.ticks_diff(time.ticks_ms(), start)))
+
         # ส่ง MQTT notification หลัง OTA เสร็จ
         self._notify_ota_complete()
-    
+
+    def _rename_replaces(self) -> bool:
+        """Whether os.rename() overwrites an existing file, probed once and cached in caps_file."""
+        import ujson
+        try:
+            with open(self.caps_file) as f:
+                caps = ujson.load(f)
+            return caps['rename_replaces']
+        except (OSError, ValueError, KeyError):
+            caps = {}
+        probe = self.caps_file + '.probe'
+        self._mk_file_dir(probe)
+        for path in (probe, probe + '2'):
+            with open(path, 'w') as f:
+                f.write('1')
+        try:
+            os.rename(probe, probe + '2')
+            result = True
+        except OSError:
+            result = False
+            os.remove(probe)
+        os.remove(probe + '2')
+        caps['rename_replaces'] = result
+        try:
+            with open(self.caps_file, 'w') as f:
+                ujson.dump(caps, f)
+        except OSError as e:
+            print('Could not save capabilities: ', e)
+        return result
+
     def _notify_ota_complete(self):
         """ส่ง MQTT notification หลัง OTA เสร็จ"""
+        if self.mqtt is None:
+            # ไม่สร้าง MQTTManager ใหม่: client id ซ้ำกับตัวหลักจะเตะ session หลักหลุด (Will + takeover)
+            print('[OTA] No MQTTManager given, version not announced')
+            return
         try:
             # อ่านเวอร์ชั่นใหม่ที่เพิ่งติดตั้ง
-            new_version = self.get_version(self.modulepath(self.main_dir))
+            new_version = self.current_version()
             
             # ถ้ามี WiFi และ MQTT ให้ส่งข้อความ
             try:
                 import network
                 sta = network.WLAN(network.STA_IF)
                 if sta.isconnected():
-                    from mqtt import MQTTManager
-                    mqtt = MQTTManager()
-                    if mqtt.connect():
-                        mqtt.publish_version(new_version, source="ota_update")
-                        print(f"[OTA] Notified MQTT: version {new_version}")
+                    import uasyncio as asyncio
+                    coro = self._publish_version(new_version)
+                    try:
+                        asyncio.current_task()
+                    except RuntimeError:
+                        # เรียกจาก sync install นอก event loop
+                        asyncio.run(coro)
+                    else:
+                        # อยู่ใน loop แล้ว (เช่น ota_check ใน main.py): ส่งเป็น background task
+                        asyncio.create_task(coro)
             except Exception as e:
                 print(f"[OTA] MQTT notification failed: {e}")
         except Exception as e:
             print(f"[OTA] Post-install notification error: {e}")
 
+    async def _publish_version(self, version):
+        # ออฟไลน์อยู่ก็เข้าคิวไว้ (QoS 1) รอ ack สั้นๆ ก่อนเครื่องรีบูต
+        await self.mqtt.publish_version(version, source="ota_update")
+        if self.mqtt.is_connected():
+            await self.mqtt.client.wait_acked(self.mqtt.ack_timeout_ms)
+
     def _rmtree(self, directory):
         for entry in os.ilistdir(directory):
             is_dir = entry[1] == 0x4000
@@ -286,34 +1001,23 @@ class OTAUpdater:
                 os.remove(directory + '/' + entry[0])
         os.rmdir(directory)
 
-    def _os_supports_rename(self) -> bool:
-        self._mk_dirs('otaUpdater/osRenameTest')
-        os.rename('otaUpdater', 'otaUpdated')
-        result = len(os.listdir('otaUpdated')) > 0
-        self._rmtree('otaUpdated')
-        return result
-
-    def _copy_directory(self, fromPath, toPath):
-        if not self._exists_dir(toPath):
-            self._mk_dirs(toPath)
-
-        for entry in os.ilistdir(fromPath):
-            is_dir = entry[1] == 0x4000
-            if is_dir:
-                self._copy_directory(fromPath + '/' + entry[0], toPath + '/' + entry[0])
-            else:
-                self._copy_file(fromPath + '/' + entry[0], toPath + '/' + entry[0])
-
     def _copy_file(self, fromPath, toPath):
-        with open(fromPath) as fromFile:
-            with open(toPath, 'w') as toFile:
-                CHUNK_SIZE = 512 # bytes
-                data = fromFile.read(CHUNK_SIZE)
-                while data:
-                    toFile.write(data)
-                    data = fromFile.read(CHUNK_SIZE)
-            toFile.close()
-        fromFile.close()
+        # binary + buffer ขนาดเดียวกับตอนดาวน์โหลด
+        buf = bytearray(self.buffer_size)
+        mv = memoryview(buf)
+        with open(fromPath, 'rb') as fromFile:
+            with open(toPath, 'wb') as toFile:
+                n = fromFile.readinto(buf)
+                while n:
+                    toFile.write(buf if n == len(buf) else mv[:n])
+                    n = fromFile.readinto(buf)
+
+    def _exists_file(self, path) -> bool:
+        try:
+            os.stat(path)
+            return True
+        except OSError:
+            return False
 
     def _exists_dir(self, path) -> bool:
         try:
@@ -322,6 +1026,11 @@ class OTAUpdater:
         except:
             return False
 
+    def _mk_file_dir(self, path):
+        parent = path.rpartition('/')[0]
+        if parent:
+            self.mkdir(parent)
+
     def _mk_dirs(self, path:str):
         paths = path.split('/')
 
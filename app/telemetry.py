@@ -0,0 +1,248 @@
+# telemetry.py - encoding แบบ compact ของ payload MQTT (ใช้ได้ทั้งบนบอร์ดและบนเครื่อง host)
+#
+# payload = FORMAT_CBOR (1 byte) + ค่า CBOR (RFC 8949) ของ dict
+# key ที่อยู่ใน KEYS ถูกเขียนเป็นเลข index แทนชื่อ (key อื่นเป็น text ตามปกติ)
+# JSON ขึ้นต้นด้วย '{' เสมอ ฝั่ง backend แยกสองแบบได้จาก byte แรก (ดู tools/telemetry_decode.py)
+import struct
+
+FORMAT_CBOR = 0x01
+
+# ต่อท้ายได้อย่างเดียว ห้ามลบหรือสลับลำดับ: เลข index คือ key บนสาย
+KEYS = (
+    'state', 'timestamp', 'uptime', 'status', 'data', 'version', 'source', 'sysinfo',
+    'platform', 'cpu_freq', 'sys_version', 'mp_version', 'os_uname', 'unique_id', 'cpu_freq_hz', 'rtc_localtime',
+    'mem_free', 'mem_alloc', 'fs_total', 'fs_used', 'fs_free',
+    'sta_active', 'sta_mac', 'sta_ip', 'sta_gw', 'sta_dns', 'sta_hostname', 'sta_rssi',
+    'ap_active', 'ap_mac', 'ap_ip', 'ap_essid',
+    'device_id', 'echo', 'temp', 'flash_size', 'uptime_ms', 'free_memory', 'allocated_memory', 'error',
+    'seq', 'full',
+)
+KEY_INDEX = {k: i for i, k in enumerate(KEYS)}
+
+
+def _head(out, major, n):
+    major <<= 5
+    if n < 24:
+        out.append(major | n)
+    elif n < 0x100:
+        out.append(major | 24)
+        out.append(n)
+    elif n < 0x10000:
+        out.append(major | 25)
+        out += struct.pack('>H', n)
+    elif n < 0x100000000:
+        out.append(major | 26)
+        out += struct.pack('>I', n)
+    else:
+        out.append(major | 27)
+        out += struct.pack('>Q', n)
+
+
+def _encode(out, value):
+    # bool ก่อน int: True/False เป็น int ด้วย
+    if value is True:
+        out.append(0xF5)
+    elif value is False:
+        out.append(0xF4)
+    elif value is None:
+        out.append(0xF6)
+    elif isinstance(value, int):
+        if value >= 0:
+            _head(out, 0, value)
+        else:
+            _head(out, 1, -1 - value)
+    elif isinstance(value, float):
+        # float ของ MicroPython บน ESP32 เป็น single precision อยู่แล้ว
+        out.append(0xFA)
+        out += struct.pack('>f', value)
+    elif isinstance(value, str):
+        b = value.encode()
+        _head(out, 3, len(b))
+        out += b
+    elif isinstance(value, (bytes, bytearray)):
+        _head(out, 2, len(value))
+        out += value
+    elif isinstance(value, (list, tuple)):
+        _head(out, 4, len(value))
+        for item in value:
+            _encode(out, item)
+    elif isinstance(value, dict):
+        _head(out, 5, len(value))
+        for k, v in value.items():
+            i = KEY_INDEX.get(k)
+            _encode(out, k if i is None else i)
+            _encode(out, v)
+    else:
+        _encode(out, str(value))
+
+
+def encode(value, out=None):
+    """Encode value as FORMAT_CBOR + CBOR into out (a bytearray, new one if None)."""
+    if out is None:
+        out = bytearray()
+    out.append(FORMAT_CBOR)
+    _encode(out, value)
+    return out
+
+
+def _decode(data, pos):
+    ib = data[pos]
+    major = ib >> 5
+    info = ib & 0x1F
+    pos += 1
+    if major == 7:
+        if info == 20:
+            return False, pos
+        if info == 21:
+            return True, pos
+        if info in (22, 23):
+            return None, pos
+        if info == 25:
+            # half float: ขยายเป็น float32 แล้ว unpack
+            h = struct.unpack_from('>H', data, pos)[0]
+            sign, exp, frac = h >> 15, (h >> 10) & 0x1F, h & 0x3FF
+            if exp == 0:
+                value = frac * 2.0 ** -24
+            elif exp == 31:
+                value = float('inf') if not frac else float('nan')
+            else:
+                value = (1024 + frac) * 2.0 ** (exp - 25)
+            return -value if sign else value, pos + 2
+        if info == 26:
+            return struct.unpack_from('>f', data, pos)[0], pos + 4
+        if info == 27:
+            return struct.unpack_from('>d', data, pos)[0], pos + 8
+        raise ValueError('Unsupported CBOR simple value {}'.format(info))
+    if info < 24:
+        n = info
+    elif info == 24:
+        n = data[pos]
+        pos += 1
+    elif info == 25:
+        n = struct.unpack_from('>H', data, pos)[0]
+        pos += 2
+    elif info == 26:
+        n = struct.unpack_from('>I', data, pos)[0]
+        pos += 4
+    elif info == 27:
+        n = struct.unpack_from('>Q', data, pos)[0]
+        pos += 8
+    else:
+        raise ValueError('Unsupported CBOR length {}'.format(info))
+    if major == 0:
+        return n, pos
+    if major == 1:
+        return -1 - n, pos
+    if major == 2:
+        return bytes(data[pos:pos + n]), pos + n
+    if major == 3:
+        return bytes(data[pos:pos + n]).decode(), pos + n
+    if major == 4:
+        items = []
+        for _ in range(n):
+            item, pos = _decode(data, pos)
+            items.append(item)
+        return items, pos
+    if major == 5:
+        d = {}
+        for _ in range(n):
+            k, pos = _decode(data, pos)
+            v, pos = _decode(data, pos)
+            if isinstance(k, int) and 0 <= k < len(KEYS):
+                k = KEYS[k]
+            d[k] = v
+        return d, pos
+    raise ValueError('Unsupported CBOR major type {}'.format(major))
+
+
+def decode(data):
+    """Decode a FORMAT_CBOR payload back to the original dict (key indexes -> names)."""
+    if not data or data[0] != FORMAT_CBOR:
+        raise ValueError('Not a compact telemetry payload')
+    value, pos = _decode(data, 1)
+    if pos != len(data):
+        raise ValueError('Trailing bytes in payload')
+    return value
+
+
+class PayloadWriter:
+    """
+    Payload built in place in one preallocated bytearray, for messages sent often.
+
+    reset() then append with raw()/uint()/cbor_*(); view() is the written part.
+    Bytes are copied one at a time and numbers written digit by digit, without
+    str() or slices (view() creates one memoryview; ints above the small-int
+    range, e.g. time.time() on a 1970-epoch port, are boxed by the caller anyway).
+    Per-publish heap use is measured by tools/mqtt_alloc_check.py on the unix port.
+    """
+
+    def __init__(self, size=128):
+        self.buf = bytearray(size)
+        self._mv = memoryview(self.buf)
+        self.n = 0
+
+    def reset(self):
+        self.n = 0
+
+    def view(self):
+        return self._mv[:self.n]
+
+    def byte(self, b):
+        self.buf[self.n] = b
+        self.n += 1
+
+    def raw(self, data):
+        buf = self.buf
+        n = self.n
+        for b in data:
+            buf[n] = b
+            n += 1
+        self.n = n
+
+    def uint(self, value):
+        # ฐานสิบ: นับหลักก่อนแล้วเขียนจากหลักท้าย ไม่ผ่าน str()
+        digits = 1
+        v = value
+        while v >= 10:
+            v //= 10
+            digits += 1
+        i = self.n + digits
+        self.n = i
+        while True:
+            i -= 1
+            self.buf[i] = 48 + value % 10
+            value //= 10
+            if not value:
+                return
+
+    def cbor_head(self, major, n):
+        major <<= 5
+        if n < 24:
+            self.byte(major | n)
+            return
+        if n < 0x100:
+            self.byte(major | 24)
+            size = 1
+        elif n < 0x10000:
+            self.byte(major | 25)
+            size = 2
+        elif n < 0x100000000:
+            self.byte(major | 26)
+            size = 4
+        else:
+            self.byte(major | 27)
+            size = 8
+        shift = size * 8
+        while shift:
+            shift -= 8
+            self.byte((n >> shift) & 0xFF)
+
+    def cbor_key(self, name):
+        self.cbor_head(0, KEY_INDEX[name])
+
+    def cbor_uint(self, value):
+        self.cbor_head(0, value)
+
+    def cbor_text(self, data):
+        self.cbor_head(3, len(data))
+        self.raw(data)
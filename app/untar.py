@@ -0,0 +1,147 @@
+# untar.py - แตก tar archive จาก stream ลง flash ทีละ block (ไม่โหลดทั้งไฟล์เข้า RAM)
+import os
+import ubinascii
+try:
+    import hashlib
+except ImportError:
+    try:
+        import uhashlib as hashlib
+    except ImportError:
+        hashlib = None
+
+BLOCK_SIZE = 512
+
+_TYPE_FILE = (0x30, 0x00, 0x37)  # '0', '\0' (old tar), '7' (contiguous)
+_TYPE_DIR = 0x35                 # '5'
+
+
+try:
+    import io
+
+    class _Reader(io.IOBase):
+        # ห่อ object ที่มี readinto() ให้เป็น stream จริง เพื่อส่งต่อให้ตัว decompress ที่เขียนด้วย C
+        def __init__(self, stream):
+            self._stream = stream
+
+        def readinto(self, buf):
+            return self._stream.readinto(buf)
+except (ImportError, AttributeError):
+    _Reader = None
+
+
+def decompressor(stream, gzip=True):
+    """Wrap a readinto() stream with the firmware's deflate decoder (deflate or uzlib)."""
+    try:
+        import deflate
+        return deflate.DeflateIO(_Reader(stream), deflate.AUTO)
+    except ImportError:
+        import uzlib
+        return uzlib.DecompIO(_Reader(stream), 31 if gzip else 15)
+
+
+def _read_block(stream, mv):
+    n = 0
+    while n < BLOCK_SIZE:
+        r = stream.readinto(mv[n:])
+        if not r:
+            if n == 0:
+                return False
+            raise OSError('Truncated tar archive')
+        n += r
+    return True
+
+
+def _field(block, start, length):
+    end = start
+    stop = start + length
+    while end < stop and block[end]:
+        end += 1
+    return str(bytes(block[start:end]), 'utf-8')
+
+
+def _mkdirs(path):
+    parts = path.split('/')
+    for i in range(1, len(parts) + 1):
+        d = '/'.join(parts[:i])
+        if d:
+            try:
+                os.mkdir(d)
+            except OSError:
+                pass
+
+
+def extract(stream, dest, strip=''):
+    """Extract a tar stream into dest.
+
+    strip: leading path prefix to drop from member names (e.g. 'main/'); members
+    outside it are skipped. Absolute names and '..' components raise OSError.
+    Returns {relative path: git blob sha} of the extracted files (sha is None without hashlib).
+    """
+    files = {}
+    for _ in iter_extract(stream, dest, strip, files):
+        pass
+    return files
+
+
+def iter_extract(stream, dest, strip, files):
+    """Generator version of extract(): fills files and yields after every block,
+    so a uasyncio caller can let other tasks run between blocks."""
+    block = bytearray(BLOCK_SIZE)
+    mv = memoryview(block)
+    while _read_block(stream, mv):
+        if not block[0]:
+            # บล็อกว่าง = จบ archive
+            break
+        name = _field(block, 0, 100)
+        if bytes(block[257:262]) == b'ustar':
+            prefix = _field(block, 345, 155)
+            if prefix:
+                name = prefix + '/' + name
+        size = int(_field(block, 124, 12).strip() or '0', 8)
+        typeflag = block[156]
+
+        while name.startswith('./'):
+            name = name[2:]
+        remaining = size
+        if typeflag == _TYPE_DIR or typeflag in _TYPE_FILE:
+            # ห้ามเขียนออกนอก dest: archive ที่แพ็คผิด/ถูกแก้ต้องไม่ทับไฟล์อื่นบน flash
+            if name.startswith('/') or '..' in name.split('/'):
+                raise OSError('Unsafe path in tar archive: ' + name)
+            if strip and (name + '/').startswith(strip):
+                name = name[len(strip):]
+            elif strip:
+                print('\tSkipped (outside {}): '.format(strip), name)
+                typeflag = None
+        name = name.rstrip('/')
+        path = dest + '/' + name if name else dest
+
+        if typeflag == _TYPE_DIR:
+            _mkdirs(path)
+        elif typeflag in _TYPE_FILE and name:
+            _mkdirs(path.rpartition('/')[0])
+            h = None
+            if hashlib:
+                h = hashlib.sha1(b'blob %d\0' % size)
+            with open(path, 'wb') as f:
+                while remaining > 0:
+                    if not _read_block(stream, mv):
+                        raise OSError('Truncated tar archive')
+                    n = remaining if remaining < BLOCK_SIZE else BLOCK_SIZE
+                    data = block if n == BLOCK_SIZE else mv[:n]
+                    f.write(data)
+                    if h:
+                        h.update(data)
+                    remaining -= n
+                    yield
+            if h:
+                files[name] = ubinascii.hexlify(h.digest()).decode()
+            else:
+                files[name] = None
+            print('\tExtracted: ', path, size)
+        # symlink / pax header / อื่น ๆ: ข้าม data ไป
+        while remaining > 0:
+            if not _read_block(stream, mv):
+                raise OSError('Truncated tar archive')
+            remaining -= BLOCK_SIZE
+            yield
+        yield
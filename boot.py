@@ -4,58 +4,35 @@
 #import webrepl
 #webrepl.start()
 # boot.py
-import sys, time
-from app.ota_updater import OTAUpdater
+import sys, os
 
-# ตั้งค่ารีโปที่จะดึง OTA
-GITHUB_REPO   = "Tatonq/esp32-home"   # ตัวอย่างจากลิงก์
-GITHUB_SRC_DIR= ""                    # ถ้าโค้ดอยู่รากให้ว่าง, ถ้าอยู่โฟลเดอร์ย่อยใส่เช่น "src"
-MODULE        = ""                    # ปล่อยว่าง = เขียนทับรากไฟล์ระบบ (โค้ด ota นี้รองรับ)
-MAIN_DIR      = "main"                # ต้องตรงกับฝั่งรีโป
-NEXT_DIR      = "next"
+MODULE        = ""                    # ต้องตรงกับ module ของ OTAUpdater ใน main.py
+SLOT_FILE     = "/config/ota_slot"    # ต้องตรงกับ app.ota_updater.SLOT_FILE
 
-# สร้างอ็อบเจ็กต์ OTA (แนบ header ถ้ามี token)
-try:
-    import ujson
-    with open('/config/github.json', 'r') as f:
-        github_config = ujson.load(f)
-    github_token = github_config.get('github_token', '')
-    GITHUB_REPO = github_config.get('github_repo', 'Tatonq/esp32-home')
-except:
-    github_token = ''
-    print("[OTA] No GitHub config found, using default settings")
+# การเช็ค/ติดตั้ง OTA ย้ายไปเป็น background task ใน main.py หลังต่อเน็ตได้แล้ว ไม่บล็อกการบูต
+# เข้า main ของเรา (จาก slot ที่ active ถ้าติดตั้งแบบ A/B แล้ว)
+# อ่าน pointer เองโดยไม่ import app: import ก่อนเพิ่ม path จะได้ app/ จาก root แทนของใน slot
+def _active_slot():
+    # .tmp มีแค่ตอนไฟดับระหว่างสลับ pointer (ดู OTAUpdater._switch_slot)
+    for path in (SLOT_FILE, SLOT_FILE + ".tmp"):
+        try:
+            with open(path) as f:
+                slot = f.read().strip()
+        except OSError:
+            continue
+        if not slot:
+            continue
+        slot_dir = "/" + MODULE + "/" + slot if MODULE else "/" + slot
+        try:
+            if os.stat(slot_dir)[0] & 0x4000:
+                return slot, slot_dir
+        except OSError:
+            pass
+        print("[OTA] Slot {} from {} not found, ignoring".format(slot, path))
+    return None, None
 
-headers = {
-    b"Accept": b"application/vnd.github+json",
-    b"X-GitHub-Api-Version": b"2022-11-28",
-}
-
-if github_token:
-    headers[b"Authorization"] = f"Bearer {github_token}".encode()
-    print("[OTA] Using GitHub token authentication")
-else:
-    print("[OTA] Warning: No GitHub token - private repos will not work")
-o = OTAUpdater(
-    github_repo=GITHUB_REPO,
-    github_src_dir=GITHUB_SRC_DIR,
-    module=MODULE,
-    main_dir=MAIN_DIR,
-    new_version_dir=NEXT_DIR,
-    headers=headers
-)
-
-# 1) เช็คว่ามีไฟล์ next/.version ไหม -> ถ้ามีก็ติดตั้งเลย
-try:
-    # ถ้ามีไฟล์เวอร์ชันแล้ว -> ติดตั้ง
-    did = o.install_update_if_available_after_boot(ssid="", password="")
-    if did:
-        print("[OTA] Update installed, rebooting...")
-        import machine
-        machine.reset()
-    else:
-        print("[OTA] No pending updates")
-except Exception as e:
-    print("[OTA] boot install error:", e)
-
-# 2) เข้า main ของเรา
+slot, slot_dir = _active_slot()
+if slot:
+    sys.path.insert(0, slot_dir)
+    print("[OTA] Active slot:", slot)
 import main
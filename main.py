@@ -10,51 +10,47 @@ import gc
 
 
 GITHUB_REPO   = "Tatonq/esp32-home"
-
-# อ่าน GitHub config
-try:
-    import ujson
-    with open('/config/github.json', 'r') as f:
-        github_config = ujson.load(f)
-    github_token = github_config.get('github_token', '')
-    GITHUB_REPO = github_config.get('github_repo', 'Tatonq/esp32-home')
-except:
-    github_token = ''
-    GITHUB_REPO = "Tatonq/esp32-home"
-    print("[OTA] No GitHub config found, using default settings")
-
-# สร้าง headers สำหรับ private repo
-headers = {
-    b"Accept": b"application/vnd.github+json",
-    b"X-GitHub-Api-Version": b"2022-11-28",
-}
-
-if github_token:
-    headers[b"Authorization"] = f"Bearer {github_token}".encode()
-
-o = OTAUpdater(
-    github_repo=GITHUB_REPO, 
+OTA_RETRY_SEC = 300                   # รอก่อนลองใหม่ถ้าเช็ค OTA ไม่สำเร็จ
+SYSINFO_SEC   = 300                   # เช็ค sysinfo ทุก 5 นาที (ส่งเฉพาะ field ที่เปลี่ยนเกิน threshold)
+
+# ข้อความระหว่างออฟไลน์: RAM 16 ข้อความ / 4 KB, ล้นแล้วลง flash ring 32 x 256 bytes (อยู่รอดรีบูต)
+# keepalive 120 วิ: broker ประกาศ Last Will "offline" ภายใน ~3 นาทีถ้าเครื่องเงียบไป
+# sysinfo_delta: snapshot เต็มตอนต่อ broker แล้วส่งแค่ส่วนที่เปลี่ยนไปที่ .../sysinfo/delta
+mqtt = MQTTManager(server="localhost", keepalive=120, clean_session=False, spill_file="/config/mqtt_spill.bin",
+                   sysinfo_delta=True)
+
+# repo/token/TTL อ่านจาก /config/github.json
+o = OTAUpdater.from_config(
+    GITHUB_REPO,
     main_dir="main", 
     new_version_dir="next",
-    headers=headers
+    keep_alive=True,
+    mqtt=mqtt
 )
 
 led = Pin(2, Pin.OUT)
-wm = WiFiManager()
-mqtt = MQTTManager(server="localhost")
-
-# เช็ค OTA
-print("[OTA] Checking for updates...")
-print("[OTA] GitHub repo:", GITHUB_REPO)
-print("[OTA] Using token:", "Yes" if github_token else "No")
-updated = o.install_update_if_available()
-if updated:
-    import machine
-    print("[OTA] Updated. Rebooting...")
-    time.sleep(1)
-    machine.reset()
-else:
-    print("[OTA] No new updates found")
+wm = WiFiManager(mqtt=mqtt)
+# set เมื่อมีเน็ตและ sync เวลาแล้ว (TTL ของ OTA ใช้เวลาจริง)
+online = asyncio.Event()
+# set โดยคำสั่ง ota/check ทาง MQTT: เช็ค OTA ทันทีไม่ต้องรอ TTL
+ota_now = asyncio.Event()
+
+
+# คำสั่งจาก backend: esp/<device_id>/cmd/<name> หรือ esp/all/cmd/<name>
+async def cmd_sysinfo(topic, msg):
+    # backend เห็น seq ข้ามก็ขอ snapshot เต็มใหม่ทางนี้
+    await mqtt.publish_sysinfo(full=True)
+
+async def cmd_ota_check(topic, msg):
+    ota_now.set()
+
+async def cmd_ping(topic, msg):
+    await mqtt.publish(mqtt.topic_prefix + "/pong", {
+        "device_id": mqtt.device_id,
+        "timestamp": time.time(),
+        "uptime": time.ticks_ms() // 1000,
+        "echo": msg.decode()
+    })
 
 
 async def blink():
@@ -76,11 +72,17 @@ async def caretaker():
     # (ออปชัน) Watchdog
     wm.start_watchdog(timeout_ms=15000, feed_every_ms=3000, timer_id=0)
 
+    # sysinfo เต็มส่งตอนต่อ broker / เมื่อ backend ขอ, รอบ SYSINFO_SEC ส่งแค่ delta
+    await mqtt.command("sysinfo", cmd_sysinfo)
+    await mqtt.command("ota/check", cmd_ota_check)
+    await mqtt.command("ping", cmd_ping)
+
     synced = False
     mqtt_connected = False
-    health_timer = 0
-    sysinfo_timer = 0
     version_sent = False  # เพิ่มตัวแปรนี้
+    boot_ms = None
+    sysinfo_timer = 0
+    step = 1
     
     print("[SYS] Initial system info:")
     myos.print_info()
@@ -94,6 +96,7 @@ async def caretaker():
             wm.ntp_sync(host="pool.ntp.org", tz_offset_hours=7)
             print("Localtime:", wm.localtime())
             synced = True
+            online.set()
 
             # ✅ แสดงข้อมูล client/เครื่องอีกครั้งเมื่อออนไลน์แล้ว
             print("\n[SYS] Connected info:")
@@ -101,46 +104,68 @@ async def caretaker():
         
         # MQTT management
         if wm.sta.isconnected():
+            # broker หลุดเอง (reader/keepalive ตัดการเชื่อมต่อ) ให้ต่อใหม่รอบนี้เลย
+            mqtt_connected = mqtt.is_connected()
             # เชื่อมต่อ MQTT ถ้ายังไม่ได้เชื่อมต่อ
             if not mqtt_connected:
                 print("[MQTT] Attempting to connect...")
-                mqtt_connected = mqtt.connect()
+                mqtt_connected = await mqtt.connect()
                 if mqtt_connected:
                     print("[MQTT] Connected successfully")
-                    mqtt.publish_status("online", {"source": "boot"})
+                    if boot_ms is None:
+                        # connect() ส่ง health เป็นข้อความแรก: วัดเวลาจากบูตถึงตรงนี้
+                        boot_ms = time.ticks_ms()
+                        print("[BOOT] First MQTT publish {} ms after boot".format(boot_ms))
+                    await mqtt.publish_status("online", {"source": "boot"})
                     
                     # ส่งเวอร์ชั่นครั้งแรกหลังเชื่อมต่อ MQTT
                     if not version_sent:
                         try:
-                            with open('main/.version', 'r') as f:
-                                current_version = f.read().strip()
-                            mqtt.publish_version(current_version, source="boot")
-                            version_sent = True
+                            version_sent = await mqtt.publish_version(o.current_version(), source="boot")
                         except:
                             pass
-            
-            # ส่ง health ping ทุก 30 วินาที
-            if mqtt_connected and health_timer >= 30:
-                mqtt.publish_health("online")
-                health_timer = 0
-            
-            # ส่ง sysinfo ทุก 5 นาที (300 วินาที)
-            if mqtt_connected and sysinfo_timer >= 300:
-                mqtt.publish_sysinfo()
-                sysinfo_timer = 0
+
+            if mqtt_connected:
+                sysinfo_timer += step
+                if sysinfo_timer >= SYSINFO_SEC:
+                    sysinfo_timer = 0
+                    await mqtt.publish_sysinfo()
         else:
             # ไม่มี WiFi - ตัดการเชื่อมต่อ MQTT
             if mqtt_connected:
-                mqtt.disconnect()
+                await mqtt.disconnect()
                 mqtt_connected = False
 
-        # เพิ่ม timer counters
-        health_timer += 10
-        sysinfo_timer += 10
+        # ระหว่างรอเน็ต/MQTT ครั้งแรกเช็คถี่ขึ้น ไม่ต้องรอทีละ 10 วิ
+        step = 10 if mqtt_connected else 1
 
-        await asyncio.sleep(10)  # เช็กทุก 10 วิ
+        await asyncio.sleep(step)  # เช็กทุก 10 วิ (ทุก 1 วิ จนกว่า MQTT จะต่อได้)
+
+async def ota_check():
+    # เช็ค OTA เบื้องหลังหลังจากออนไลน์แล้ว ไม่เกิน 1 ครั้งต่อ TTL (+ jitter)
+    await online.wait()
+    print("[OTA] GitHub repo:", o.github_repo)
+    wait = o.seconds_until_check()
+    while True:
+        print("[OTA] Next update check in {} s".format(wait))
+        try:
+            await asyncio.wait_for(ota_now.wait(), wait)
+            print("[OTA] Check requested over MQTT")
+        except asyncio.TimeoutError:
+            pass
+        ota_now.clear()
+        if wm.sta.isconnected():
+            updated = await o.install_update_if_available_async()
+            if updated:
+                import machine
+                print("[OTA] Updated. Rebooting...")
+                await asyncio.sleep(1)
+                # ปิดแบบปกติ: health "offline" + รอ PUBACK ที่ค้าง (Will ใช้เฉพาะตอนหลุด/ค้าง)
+                await mqtt.disconnect()
+                machine.reset()
+        wait = max(o.seconds_until_check(), OTA_RETRY_SEC)
 
 async def main():
-    await asyncio.gather(blink(), caretaker())
+    await asyncio.gather(blink(), caretaker(), ota_check())
 
 asyncio.run(main())
@@ -2,24 +2,67 @@
 import ujson
 import time
 import machine
-from umqtt.simple import MQTTClient
+from app.mqtt_client import AsyncMQTTClient
+from app.mqtt_queue import MessageQueue, FlashRing
+from app.mqtt_router import TopicRouter
+from app import telemetry
+import uasyncio as asyncio
 import ubinascii
 import gc
 
+# delta sysinfo: เปลี่ยนน้อยกว่านี้ (ค่าสัมบูรณ์) ไม่นับว่าเปลี่ยน
+SYSINFO_THRESHOLDS = {
+    "mem_free": 8192,
+    "mem_alloc": 8192,
+    "fs_used": 4096,
+    "fs_free": 4096,
+    "sta_rssi": 6,
+}
+# เปลี่ยนทุกครั้งที่อ่าน ไม่ส่งใน delta (ดูจาก timestamp / health แทน)
+SYSINFO_VOLATILE = ("uptime", "rtc_localtime")
+
 class MQTTManager:
     """
     MQTT Manager สำหรับ ESP32
     รองรับการส่ง status, health, และ sysinfo
+    connect/publish ทั้งหมดเป็น coroutine (await) ไม่บล็อก uasyncio loop
+    ระหว่างออฟไลน์ข้อความเข้าคิว (MessageQueue) แล้วส่งรวดเดียวตอนต่อกลับได้
+    health เป็น retained + Last Will: broker ประกาศ "offline" ให้เองเมื่อเครื่องหลุด/ค้าง
+    ไม่ต้องส่ง health ซ้ำเป็นระยะ (ส่งเมื่อ state เปลี่ยนเท่านั้น)
     """
     
-    def __init__(self, server="localhost", port=1883, username=None, password=None, keepalive=60):
+    def __init__(self, server="localhost", port=1883, username=None, password=None, keepalive=60,
+                 queue_size=16, queue_bytes=4096, spill_file=None, spill_slots=32, spill_slot_size=256,
+                 window=8, ack_timeout_ms=5000, clean_session=True, encoding="json", debug=False,
+                 sysinfo_delta=False, sysinfo_thresholds=None):
         self.server = server
         self.port = port
         self.username = username
         self.password = password
-        self.keepalive = keepalive
+        self.keepalive_sec = keepalive
+        # "json" หรือ "cbor" (app/telemetry.py: version byte + CBOR, ไม่มี device_id ซ้ำกับ topic)
+        if encoding not in ("json", "cbor"):
+            raise ValueError("Unknown MQTT encoding: {}".format(encoding))
+        self.encoding = encoding
+        # True = พิมพ์ทุก payload ที่ส่งออก UART (ช้าและสร้าง string ทุกครั้ง)
+        self.debug = debug
+        self.window = window
+        self.ack_timeout_ms = ack_timeout_ms
+        # False = broker จำ session (subscription, QoS 1 ค้างส่ง) ข้ามการหลุด
+        self.clean_session = clean_session
+        self.session_present = False
         self.client = None
         self.connected = False
+        # health state ล่าสุดที่ broker มี (None = ต้องส่งใหม่)
+        self._health = None
+        # delta sysinfo: snapshot เต็ม (retained) ครั้งแรกของทุกการเชื่อมต่อ แล้วส่งเฉพาะ field ที่เปลี่ยน
+        # ทุกข้อความมี seq เรียงกัน backend เห็นเลขข้ามก็สั่ง cmd/sysinfo เพื่อขอ snapshot ใหม่
+        self.sysinfo_delta = sysinfo_delta
+        self.sysinfo_thresholds = SYSINFO_THRESHOLDS if sysinfo_thresholds is None else sysinfo_thresholds
+        self._sysinfo_last = None
+        self._sysinfo_seq = 0
+        spill = FlashRing(spill_file, spill_slots, spill_slot_size) if spill_file else None
+        self.queue = MessageQueue(queue_size, queue_bytes, spill)
         
         # สร้าง unique client ID และ device serial
         self.device_id = ubinascii.hexlify(machine.unique_id()).decode()
@@ -30,28 +73,73 @@ class MQTTManager:
         self.status_topic = f"{self.topic_prefix}/status"
         self.health_topic = f"{self.topic_prefix}/health"
         self.sysinfo_topic = f"{self.topic_prefix}/sysinfo"
+        self.sysinfo_delta_topic = f"{self.sysinfo_topic}/delta"
+        self.version_topic = f"{self.topic_prefix}/version"
+        self.cmd_topic = f"{self.topic_prefix}/cmd"
+        
+        # topic แบบ bytes encode ครั้งเดียว: publish ไม่ต้อง encode ใหม่ทุกครั้ง
+        self._status_t = self.status_topic.encode()
+        self._health_t = self.health_topic.encode()
+        self._sysinfo_t = self.sysinfo_topic.encode()
+        self._sysinfo_delta_t = self.sysinfo_delta_topic.encode()
+        self._version_t = self.version_topic.encode()
+        
+        # health ส่งบ่อยที่สุด: เขียน payload ลง buffer เดิมทุกครั้งแทน dict + ujson.dumps
+        self._writer = telemetry.PayloadWriter(128)
+        self._writer_busy = False
+        self._health_json = (b'{"state": "', b'", "timestamp": ',
+                             b', "device_id": "' + self.device_id.encode() + b'", "uptime": ', b'}')
+        # state (str) -> bytes ที่ encode แล้ว
+        self._words = {}
+        
+        # topic filter ที่ subscribe ไว้ + handler ของข้อความขาเข้า
+        self.subscriptions = []
+        self.router = TopicRouter()
         
         print(f"[MQTT] Device ID: {self.device_id}")
         print(f"[MQTT] Client ID: {self.client_id}")
     
-    def connect(self):
+    async def connect(self):
         """เชื่อมต่อ MQTT broker"""
         try:
-            self.client = MQTTClient(
-                client_id=self.client_id,
-                server=self.server,
-                port=self.port,
-                user=self.username,
-                password=self.password,
-                keepalive=self.keepalive
-            )
+            # ใช้ client เดิมข้ามการต่อใหม่ QoS 1 ที่ยังไม่ได้ PUBACK จะถูกส่งซ้ำตอน connect
+            if self.client is None:
+                self.client = AsyncMQTTClient(
+                    client_id=self.client_id,
+                    server=self.server,
+                    port=self.port,
+                    user=self.username,
+                    password=self.password,
+                    keepalive=self.keepalive_sec,
+                    window=self.window,
+                    ack_timeout_ms=self.ack_timeout_ms
+                )
+                self.client.set_last_will(self.health_topic, self._encode({
+                    "state": "offline",
+                    "device_id": self.device_id
+                }), retain=True, qos=1)
+                self.client.cb = self._on_message
             
-            self.client.connect()
+            self.session_present = await self.client.connect(clean_session=self.clean_session)
             self.connected = True
-            print(f"[MQTT] Connected to {self.server}:{self.port}")
+            self._health = None
+            print(f"[MQTT] Connected to {self.server}:{self.port} (session {'resumed' if self.session_present else 'new'})")
+            
+            # subscribe ใหม่ทุกครั้ง: session ที่ broker ว่า resumed ก็อาจไม่มี subscription ครบ
+            # (broker รีสตาร์ทแบบไม่เก็บ session, subscribe() ระหว่างออฟไลน์) ส่งซ้ำ broker ก็แค่แทนของเดิม
+            if self.subscriptions:
+                await self.client.subscribe(self.subscriptions)
+            
+            # ส่งของค้างในคิวก่อน health ใหม่ ไม่ให้ค่า retained เก่าทับค่าปัจจุบัน
+            await self.flush()
             
             # ส่ง initial health status
-            self.publish_health("online")
+            await self.publish_health("online")
+            
+            # snapshot เต็มของการเชื่อมต่อนี้ (delta หลังจากนี้อ้างอิงตัวนี้)
+            self._sysinfo_last = None
+            if self.sysinfo_delta:
+                await self.publish_sysinfo()
             return True
             
         except Exception as e:
@@ -59,46 +147,127 @@ class MQTTManager:
             self.connected = False
             return False
     
-    def disconnect(self):
+    async def disconnect(self):
         """ตัดการเชื่อมต่อ MQTT"""
         if self.client and self.connected:
             try:
                 # ส่ง offline status ก่อนตัดการเชื่อมต่อ
-                self.publish_health("offline")
-                self.client.disconnect()
+                await self.publish_health("offline")
+                # รอ PUBACK ของ QoS 1 ที่ค้างอยู่ก่อนปิด
+                await self.client.wait_acked(self.ack_timeout_ms)
+                await self.client.disconnect()
                 print("[MQTT] Disconnected")
             except Exception as e:
                 print(f"[MQTT] Disconnect error: {e}")
             finally:
                 self.connected = False
-                self.client = None
     
     def is_connected(self):
         """เช็คสถานะการเชื่อมต่อ"""
-        return self.connected and self.client is not None
+        return self.connected and self.client is not None and self.client.connected
     
-    def publish(self, topic, message, retain=False):
-        """ส่งข้อความไป MQTT topic"""
+    async def publish(self, topic, message, retain=False, qos=0):
+        """
+        ส่งข้อความไป MQTT topic (ออฟไลน์/ส่งไม่สำเร็จ = เก็บเข้าคิว คืน False)
+        qos=1: broker ต้องตอบ PUBACK ส่งต่อกันได้ไม่เกิน window ข้อความโดยไม่รอ ack ทีละข้อความ
+        """
+        if isinstance(message, dict):
+            message = self._encode(message)
+        elif isinstance(message, memoryview):
+            # buffer ของ PayloadWriter: ส่งตรงได้ แต่เข้าคิวต้อง copy (buffer ถูกใช้ซ้ำ)
+            pass
+        elif not isinstance(message, (str, bytes, bytearray)):
+            message = str(message)
+        
         if not self.is_connected():
-            print("[MQTT] Not connected, cannot publish")
+            self.queue.push(topic, bytes(message) if isinstance(message, memoryview) else message, retain, qos)
+            print(f"[MQTT] Offline, queued {topic.decode() if isinstance(topic, bytes) else topic} ({len(self.queue)} waiting)")
             return False
         
         try:
-            if isinstance(message, dict):
-                message = ujson.dumps(message)
-            elif not isinstance(message, (str, bytes)):
-                message = str(message)
-                
-            self.client.publish(topic, message, retain=retain)
-            print(f"[MQTT] Published to {topic}: {message}")
+            await self.client.publish(topic, message, retain=retain, qos=qos)
+            if self.debug:
+                print(f"[MQTT] Published to {topic}: {message if isinstance(message, str) else bytes(message)}")
             return True
             
         except Exception as e:
             print(f"[MQTT] Publish error: {e}")
             self.connected = False
+            # client ไม่เก็บ QoS 1 ที่ส่งไม่ได้ไว้ใน inflight: เข้าคิวที่นี่ที่เดียว ส่งซ้ำรอบเดียวตอน flush
+            self.queue.push(topic, bytes(message) if isinstance(message, memoryview) else message, retain, qos)
             return False
     
-    def publish_status(self, status, data=None):
+    def _encode(self, payload):
+        if self.encoding == "json":
+            return ujson.dumps(payload)
+        # device_id อยู่ใน topic แล้ว
+        if "device_id" in payload:
+            payload = {k: v for k, v in payload.items() if k != "device_id"}
+        return telemetry.encode(payload)
+    
+    async def subscribe(self, pattern, handler=None):
+        """
+        Subscribe to a topic filter (+ / # ได้) และผูก handler(topic, msg) ถ้ามี
+        handler เป็น coroutine function รันเป็น task แยกทุกครั้งที่มีข้อความตรง
+        """
+        if handler is not None:
+            self.router.add(pattern, handler)
+        if pattern in self.subscriptions:
+            return True
+        self.subscriptions.append(pattern)
+        if self.is_connected():
+            try:
+                await self.client.subscribe(pattern)
+            except Exception as e:
+                print(f"[MQTT] Subscribe error: {e}")
+                return False
+        return True
+    
+    async def command(self, name, handler):
+        """
+        ผูก handler กับคำสั่ง esp/<device_id>/cmd/<name> และ esp/all/cmd/<name> (ทั้ง fleet)
+        subscribe แค่ cmd/# ของทั้งสองที่ ครั้งเดียวสำหรับทุกคำสั่ง
+        """
+        self.router.add(f"esp/+/cmd/{name}", handler)
+        await self.subscribe(f"{self.cmd_topic}/#")
+        await self.subscribe("esp/all/cmd/#")
+    
+    def _on_message(self, topic, msg):
+        topic = topic.decode()
+        handlers = self.router.match(topic)
+        if not handlers:
+            print(f"[MQTT] No handler for {topic}")
+        for handler in handlers:
+            asyncio.create_task(self._run_handler(handler, topic, msg))
+    
+    async def _run_handler(self, handler, topic, msg):
+        try:
+            await handler(topic, msg)
+        except Exception as e:
+            print(f"[MQTT] Handler error on {topic}: {e}")
+    
+    async def flush(self):
+        """ส่งข้อความที่ค้างในคิวต่อกันรวดเดียว หยุดเมื่อคิวว่างหรือหลุดอีก"""
+        sent = 0
+        while self.is_connected():
+            item = self.queue.peek()
+            if item is None:
+                break
+            topic, message, retain, qos = item
+            try:
+                await self.client.publish(topic, message, retain=retain, qos=qos)
+            except Exception as e:
+                print(f"[MQTT] Flush error: {e}")
+                self.connected = False
+                break
+            # เอาออกจากคิวหลังส่งสำเร็จเท่านั้น
+            self.queue.pop()
+            sent += 1
+        if sent:
+            print(f"[MQTT] Flushed {sent} queued messages {self.queue.stats()}")
+        return sent
+    
+    async def publish_status(self, status, data=None):
         """
         ส่งสถานะการทำงานของอุปกรณ์
         status: "working", "idle", "error", "maintenance", etc.
@@ -113,26 +282,72 @@ class MQTTManager:
         if data:
             payload["data"] = data
             
-        return self.publish(self.status_topic, payload, retain=True)
+        return await self.publish(self._status_t, payload, retain=True)
     
-    def publish_health(self, state="online"):
+    async def publish_health(self, state="online", force=False):
         """
-        ส่งสถานะ health ของอุปกรณ์
+        ส่งสถานะ health ของอุปกรณ์ เมื่อ state เปลี่ยน (หรือ force=True)
         state: "online", "offline", "rebooting", etc.
         """
-        payload = {
-            "state": state,
-            "timestamp": time.time(),
-            "device_id": self.device_id,
-            "uptime": time.ticks_ms() // 1000  # uptime in seconds
-        }
-        
-        return self.publish(self.health_topic, payload, retain=True)
+        if state == self._health and not force and self.is_connected():
+            return True
+        # อีก task กำลังใช้ buffer อยู่ (รอส่งค้าง): ใช้ dict แบบเดิม
+        use_writer = not self._writer_busy
+        self._writer_busy = True
+        try:
+            if use_writer:
+                payload = self._health_payload(state)
+            else:
+                payload = {
+                    "state": state,
+                    "timestamp": time.time(),
+                    "device_id": self.device_id,
+                    "uptime": time.ticks_ms() // 1000  # uptime in seconds
+                }
+            ok = await self.publish(self._health_t, payload, retain=True)
+        finally:
+            if use_writer:
+                self._writer_busy = False
+        if ok:
+            self._health = state
+        return ok
+    
+    def _health_payload(self, state):
+        # payload เดียวกับ dict ด้านบน เขียนลง buffer เดิมโดยไม่สร้าง object ใหม่
+        word = self._words.get(state)
+        if word is None:
+            word = self._words[state] = state.encode()
+        now = int(time.time())
+        uptime = time.ticks_ms() // 1000
+        w = self._writer
+        w.reset()
+        if self.encoding == "json":
+            parts = self._health_json
+            w.raw(parts[0])
+            w.raw(word)
+            w.raw(parts[1])
+            w.uint(now)
+            w.raw(parts[2])
+            w.uint(uptime)
+            w.raw(parts[3])
+        else:
+            # {state, timestamp, uptime} ไม่มี device_id เหมือน _encode
+            w.byte(telemetry.FORMAT_CBOR)
+            w.cbor_head(5, 3)
+            w.cbor_key("state")
+            w.cbor_text(word)
+            w.cbor_key("timestamp")
+            w.cbor_uint(now)
+            w.cbor_key("uptime")
+            w.cbor_uint(uptime)
+        return w.view()
     
-    def publish_sysinfo(self, sysinfo_data=None):
+    async def publish_sysinfo(self, sysinfo_data=None, full=False):
         """
         ส่งข้อมูลระบบ
         sysinfo_data: dict ข้อมูลระบบ หรือ None เพื่อใช้ myos.collect_info_dict()
+        sysinfo_delta=True: ส่ง snapshot เต็ม (full=True หรือยังไม่เคยส่งในการเชื่อมต่อนี้)
+        ไปที่ sysinfo แบบ retained, ไม่งั้นส่งเฉพาะ field ที่เปลี่ยนเกิน threshold ไปที่ sysinfo/delta
         """
         try:
             if sysinfo_data is None:
@@ -144,18 +359,65 @@ class MQTTManager:
                     # fallback ถ้าไม่มี myos
                     sysinfo_data = self._get_basic_sysinfo()
             
+            if not self.sysinfo_delta:
+                payload = {
+                    "device_id": self.device_id,
+                    "timestamp": time.time(),
+                    "sysinfo": sysinfo_data
+                }
+                return await self.publish(self._sysinfo_t, payload, retain=True)
+            
+            if full or self._sysinfo_last is None:
+                topic, retain, changed = self._sysinfo_t, True, sysinfo_data
+            else:
+                changed = self._sysinfo_changes(sysinfo_data)
+                if not changed:
+                    return True
+                topic, retain = self._sysinfo_delta_t, False
+            
+            self._sysinfo_seq += 1
             payload = {
                 "device_id": self.device_id,
                 "timestamp": time.time(),
-                "sysinfo": sysinfo_data
+                "seq": self._sysinfo_seq,
+                "full": retain,
+                "sysinfo": changed
             }
-            
-            return self.publish(self.sysinfo_topic, payload, retain=True)
+            # ออฟไลน์ก็นับว่าส่งแล้ว (อยู่ในคิว) ต่อใหม่เมื่อไรก็เริ่มจาก snapshot เต็มอยู่ดี
+            if retain:
+                self._sysinfo_last = dict(sysinfo_data)
+            else:
+                for k, v in changed.items():
+                    if v is None:
+                        self._sysinfo_last.pop(k, None)
+                    else:
+                        self._sysinfo_last[k] = v
+            return await self.publish(topic, payload, retain=retain, qos=1)
             
         except Exception as e:
             print(f"[MQTT] Sysinfo publish error: {e}")
             return False
     
+    def _sysinfo_changes(self, data):
+        # เทียบกับค่าที่ส่งไปล่าสุด (ไม่ใช่ค่าที่อ่านครั้งก่อน) ค่าที่ค่อยๆ ไหลจึงถูกส่งเมื่อสะสมเกิน threshold
+        last = self._sysinfo_last
+        changed = {}
+        for k, v in data.items():
+            if k in SYSINFO_VOLATILE:
+                continue
+            old = last.get(k)
+            if v == old:
+                continue
+            threshold = self.sysinfo_thresholds.get(k)
+            if threshold and isinstance(v, int) and isinstance(old, int) and abs(v - old) < threshold:
+                continue
+            changed[k] = v
+        for k in last:
+            if k not in data:
+                # field หายไป (เช่น sta_ip ตอนหลุด WiFi)
+                changed[k] = None
+        return changed
+    
     def _get_basic_sysinfo(self):
         """ข้อมูลระบบพื้นฐานถ้าไม่มี myos module"""
         try:
@@ -178,38 +440,30 @@ class MQTTManager:
                 "error": f"Cannot collect sysinfo: {e}"
             }
     
-    def keepalive(self):
-        """รักษาการเชื่อมต่อ MQTT และส่ง health ping"""
+    async def keepalive(self):
+        """เช็คการเชื่อมต่อ MQTT และให้ health บน broker เป็น online"""
         if not self.is_connected():
             return False
         
         try:
-            # ส่ง health ping
-            self.publish_health("online")
-            
-            # Check messages (รองรับ callback ในอนาคต)
-            self.client.check_msg()
-            return True
+            # PINGREQ client ส่งเองใน background task; health ส่งเฉพาะเมื่อ state เปลี่ยน
+            return await self.publish_health("online")
             
         except Exception as e:
             print(f"[MQTT] Keepalive error: {e}")
             self.connected = False
             return False
     
-    def reconnect(self):
+    async def reconnect(self):
         """พยายามเชื่อมต่อใหม่"""
-        if self.connected:
+        if self.is_connected():
             return True
             
         print("[MQTT] Attempting to reconnect...")
-        return self.connect()
+        return await self.connect()
 
-    def publish_version(self, version, source="ota"):
+    async def publish_version(self, version, source="ota"):
         """ส่งข้อมูลเวอร์ชั่นปัจจุบัน"""
-        if not self.client:
-            return False
-        
-        topic = f"esp/{self.device_id}/version"
         data = {
             "device_id": self.device_id,
             "timestamp": time.time(),
@@ -217,14 +471,11 @@ class MQTTManager:
             "source": source  # "ota", "boot", "manual"
         }
         
-        try:
-            payload = json.dumps(data)
-            self.client.publish(topic, payload)
+        # QoS 1: ประกาศเวอร์ชั่น (รวมถึงหลัง OTA) ต้องไม่หายเงียบ
+        if await self.publish(self._version_t, data, qos=1):
             print(f"[MQTT] Published version: {version}")
             return True
-        except Exception as e:
-            print(f"[MQTT] Publish version error: {e}")
-            return False
+        return False
 
 # สร้าง global instance (optional)
 # mqtt_client = None
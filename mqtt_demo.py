@@ -21,30 +21,30 @@ async def mqtt_demo():
     print(f"  Sysinfo: {mqtt.sysinfo_topic}")
     
     # เชื่อมต่อ MQTT
-    if not mqtt.connect():
+    if not await mqtt.connect():
         print("Failed to connect to MQTT")
         return
     
     try:
         # ส่ง status ต่างๆ
         await asyncio.sleep(1)
-        mqtt.publish_status("working", {"task": "initialization"})
+        await mqtt.publish_status("working", {"task": "initialization"})
         
         await asyncio.sleep(2)
-        mqtt.publish_status("idle")
+        await mqtt.publish_status("idle")
         
         # ส่ง sysinfo
         await asyncio.sleep(1)
-        mqtt.publish_sysinfo()
+        await mqtt.publish_sysinfo()
         
         # ส่ง health updates
         for i in range(5):
             await asyncio.sleep(5)
-            mqtt.keepalive()  # ส่ง health ping
+            await mqtt.keepalive()  # เช็คการเชื่อมต่อ (health ส่งเมื่อเปลี่ยนเท่านั้น)
             print(f"Health ping {i+1}/5")
         
         # ส่ง status เมื่อจบงาน
-        mqtt.publish_status("completed", {"demo": "finished"})
+        await mqtt.publish_status("completed", {"demo": "finished"})
         
     except KeyboardInterrupt:
         print("Demo interrupted")
@@ -52,7 +52,7 @@ async def mqtt_demo():
         print(f"Demo error: {e}")
     finally:
         # ตัดการเชื่อมต่อ
-        mqtt.disconnect()
+        await mqtt.disconnect()
 
 # รันถ้าเรียกไฟล์นี้โดยตรง
 if __name__ == "__main__":
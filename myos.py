@@ -31,9 +31,7 @@ def _fmt_bytes(n):
         i += 1
     return "{} {}".format(n, units[i])
 
-def _uptime_tuple():
-    ms = time.ticks_ms()
-    s = ms // 1000
+def _uptime_tuple(s):
     d, s = divmod(s, 86400)
     h, s = divmod(s, 3600)
     m, s = divmod(s, 60)
@@ -49,11 +47,16 @@ def _fs_info():
     except Exception:
         return {}
 
+_ifaces = {}
+
 def _wlan_info(kind="sta"):
     """kind: 'sta' | 'ap'"""
     if network is None:
         return {}
-    iface = network.WLAN(network.STA_IF if kind == "sta" else network.AP_IF)
+    # สร้าง WLAN object ครั้งเดียวต่อ interface
+    iface = _ifaces.get(kind)
+    if iface is None:
+        iface = _ifaces[kind] = network.WLAN(network.STA_IF if kind == "sta" else network.AP_IF)
     try:
         active = iface.active()
     except Exception:
@@ -111,14 +114,49 @@ def _wlan_info(kind="sta"):
 
 
 def _get_current_version():
-    """อ่านเวอร์ชั่นปัจจุบันจากไฟล์ .version"""
+    """อ่านเวอร์ชั่นปัจจุบันจากไฟล์ .version ของ slot ที่ active"""
+    try:
+        from app.ota_updater import read_active_slot
+        slot = read_active_slot() or 'main'
+    except ImportError:
+        slot = 'main'
     try:
-        with open('main/.version', 'r') as f:
+        with open(slot + '/.version', 'r') as f:
             return f.read().strip()
     except:
         return "unknown"
 
-def collect_info_dict():
+# ---------- sections ----------
+# static: ไม่เปลี่ยนจนกว่าจะรีบูต (OTA รีบูตเสมอ) คำนวณครั้งเดียวแล้ว cache
+# ที่เหลือเก็บใหม่ทุกครั้ง แต่เฉพาะ section ที่ถูกขอ
+SECTIONS = ("static", "time", "mem", "fs", "sta", "ap")
+
+_FIELD_SECTION = {
+    "version": "static", "platform": "static", "cpu_freq": "static", "sys_version": "static",
+    "mp_version": "static", "os_uname": "static", "unique_id": "static", "cpu_freq_hz": "static",
+    "rtc_localtime": "time", "uptime": "time",
+}
+
+# ตัวเลขดิบที่มี schema ตายตัว: (key, unit, kind) ต่อท้ายได้ ห้ามเปลี่ยน key/unit เดิม
+# gauge = ค่า ณ ตอนนั้น, counter = เพิ่มขึ้นเรื่อยๆ (รีเซ็ตเมื่อรีบูต)
+METRICS = (
+    ("uptime", "s", "counter"),
+    ("cpu_freq_hz", "Hz", "gauge"),
+    ("mem_free", "B", "gauge"),
+    ("mem_alloc", "B", "gauge"),
+    ("fs_total", "B", "gauge"),
+    ("fs_used", "B", "gauge"),
+    ("fs_free", "B", "gauge"),
+    ("sta_rssi", "dBm", "gauge"),
+)
+_UNITS = {k: unit for k, unit, kind in METRICS}
+
+_static = None
+
+def _static_info():
+    global _static
+    if _static is not None:
+        return _static
     info = {}
     
     # เพิ่มเวอร์ชั่นเป็นข้อมูลแรก
@@ -168,39 +206,41 @@ def collect_info_dict():
             info["cpu_freq_hz"] = freq if isinstance(freq, int) else str(freq)
         except Exception:
             pass
+
+    _static = info
+    return info
+
+def _time_info(info):
+    if machine:
         try:
             # RTC localtime (อาจเป็น UTC ถ้ายังไม่ได้ตั้ง NTP)
-            info["rtc_localtime"] = "{}".format(time.localtime())
+            info["rtc_localtime"] = time.localtime()
         except Exception:
             pass
 
-    # memory
+    # uptime
     try:
-        gc.collect()
-        free = gc.mem_free()
-        alloc = gc.mem_alloc()
-        info["mem_free"] = _fmt_bytes(free)
-        info["mem_alloc"] = _fmt_bytes(alloc)
+        info["uptime"] = time.ticks_ms() // 1000
     except Exception:
         pass
 
-    # filesystem
-    fs = _fs_info()
-    if fs:
-        info["fs_total"] = _fmt_bytes(fs.get("total", 0))
-        info["fs_used"]  = _fmt_bytes(fs.get("used", 0))
-        info["fs_free"]  = _fmt_bytes(fs.get("free", 0))
-
-    # uptime
+def _mem_info(info):
     try:
-        d, h, m, s = _uptime_tuple()
-        info["uptime"] = "{}d {:02d}:{:02d}:{:02d}".format(d, h, m, s)
+        gc.collect()
+        info["mem_free"] = gc.mem_free()
+        info["mem_alloc"] = gc.mem_alloc()
     except Exception:
         pass
 
-    # network
+def _fs_section(info):
+    fs = _fs_info()
+    if fs:
+        info["fs_total"] = fs.get("total", 0)
+        info["fs_used"]  = fs.get("used", 0)
+        info["fs_free"]  = fs.get("free", 0)
+
+def _sta_info(info):
     sta = _wlan_info("sta")
-    ap  = _wlan_info("ap")
     if sta:
         info["sta_active"] = sta.get("active")
         if "mac" in sta: info["sta_mac"] = sta["mac"]
@@ -209,15 +249,76 @@ def collect_info_dict():
         if "dns" in sta: info["sta_dns"] = sta["dns"]
         if "hostname" in sta: info["sta_hostname"] = sta["hostname"]
         if "rssi" in sta: info["sta_rssi"] = sta["rssi"]
+
+def _ap_info(info):
+    ap = _wlan_info("ap")
     if ap:
         info["ap_active"] = ap.get("active")
         if "mac" in ap:    info["ap_mac"] = ap["mac"]
         if "ip" in ap:     info["ap_ip"]  = ap["ip"]
         if "essid" in ap:  info["ap_essid"] = ap["essid"]
 
+def _field_section(name):
+    sec = _FIELD_SECTION.get(name)
+    if sec is None:
+        # mem_free -> mem, fs_used -> fs, sta_rssi -> sta, ap_ip -> ap
+        sec = name.split("_", 1)[0]
+    return sec
+
+def collect_info_dict(sections=None, fields=None):
+    """
+    ค่าดิบเสมอ: ขนาดเป็น byte, uptime เป็นวินาที, rtc_localtime เป็น tuple (format เฉพาะใน print_info)
+    sections: เก็บเฉพาะ section ใน SECTIONS เช่น ("mem", "sta"); None = ทั้งหมด
+    fields: คืนเฉพาะ key เหล่านี้ เช่น ("mem_free", "sta_rssi") เก็บเฉพาะ section ที่มี key นั้น
+    """
+    if fields is not None:
+        # key ที่ไม่รู้จักแค่ไม่มีในผลลัพธ์
+        sections = set(_field_section(k) for k in fields if _field_section(k) in SECTIONS)
+    elif sections is None:
+        sections = SECTIONS
+    for sec in sections:
+        if sec not in SECTIONS:
+            raise ValueError("unknown sysinfo section: {}".format(sec))
+
+    # ลำดับ key เหมือนเดิม: static ก่อน (copy เพราะ cache ใช้ร่วมกัน)
+    info = dict(_static_info()) if "static" in sections else {}
+    if "time" in sections:
+        _time_info(info)
+    if "mem" in sections:
+        _mem_info(info)
+    if "fs" in sections:
+        _fs_section(info)
+    if "sta" in sections:
+        _sta_info(info)
+    if "ap" in sections:
+        _ap_info(info)
+
+    if fields is not None:
+        info = {k: info[k] for k in fields if k in info}
     return info
 
 
+def collect_metrics(keys=None):
+    """
+    ค่าตัวเลขตาม METRICS เป็น dict {key: int} (ไม่มี key ที่อ่านไม่ได้ เช่น sta_rssi ตอนไม่ได้ต่อ WiFi)
+    keys: เฉพาะบาง metric เช่น ("mem_free",) เก็บเฉพาะ section ที่จำเป็น
+    """
+    if keys is None:
+        keys = [k for k, unit, kind in METRICS]
+    info = collect_info_dict(fields=keys)
+    return {k: v for k, v in info.items() if k in _UNITS and isinstance(v, int)}
+
+def _fmt_value(key, v):
+    unit = _UNITS.get(key)
+    if unit == "B":
+        return _fmt_bytes(v)
+    if key == "uptime":
+        return "{}d {:02d}:{:02d}:{:02d}".format(*_uptime_tuple(v))
+    if unit is not None:
+        return "{} {}".format(v, unit)
+    return v
+
+
 def collect_info_lines():
     """คืนค่าเป็น list ของบรรทัด (key: value) สำหรับ print ทีละบรรทัด"""
     d = collect_info_dict()
@@ -236,7 +337,7 @@ def collect_info_lines():
     used = set()
     for k in order:
         if k in d:
-            lines.append("{}: {}".format(k, d[k]))
+            lines.append("{}: {}".format(k, _fmt_value(k, d[k])))
             used.add(k)
     # ที่เหลือ (เผื่ออนาคต)
     for k, v in d.items():
@@ -255,9 +356,9 @@ def json_info(indent=2):
     """คืนค่า JSON string ของข้อมูลทั้งหมด"""
     return json.dumps(collect_info_dict(), indent=indent)
 
-def get_info():
-    """คืนค่า dict (ใช้ต่อในโปรแกรมอื่น)"""
-    return collect_info_dict()
+def get_info(sections=None, fields=None):
+    """คืนค่า dict (ใช้ต่อในโปรแกรมอื่น) เลือก section/field ได้เหมือน collect_info_dict()"""
+    return collect_info_dict(sections=sections, fields=fields)
 
 
 # Quick self-test
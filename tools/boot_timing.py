@@ -0,0 +1,61 @@
+# boot_timing.py - วัดเวลาจากบูตถึง MQTT publish แรก บนบอร์ดจริงผ่าน serial (รันบนเครื่อง host, ต้องมี pyserial)
+#
+#   python3 tools/boot_timing.py /dev/ttyUSB0 10
+#
+# reset บอร์ดผ่านสาย RTS (ขา EN ของ devkit) ทีละรอบ แล้วรอบรรทัด "[BOOT] First MQTT publish N ms after boot"
+# ที่ main.py พิมพ์ สรุป min / median / max ท้ายสุด (broker และ WiFi ต้องพร้อมก่อนเริ่ม)
+#
+# เทียบกับ build ก่อนย้าย OTA check ออกจาก import ของ main.py (commit ก่อน "Defer the OTA check ..."):
+#   git worktree add ../baseline <commit>
+#   ใน ../baseline/main.py ต่อจาก print("[MQTT] Connected successfully") ใส่บรรทัดเดียวกับ main.py ปัจจุบัน
+#       print("[BOOT] First MQTT publish {} ms after boot".format(time.ticks_ms()))
+#   (ครั้งแรกที่ต่อติดเท่านั้น) copy ลงบอร์ด แล้วรันสคริปต์นี้ด้วยจำนวนรอบเท่ากัน
+# caretaker ของ baseline วนทุก 10 วิ ตัวเลขจึงรวมเวลารอรอบนั้นด้วย ซึ่งเป็นส่วนหนึ่งของสิ่งที่เปลี่ยน
+import re
+import sys
+import time
+
+import serial
+
+PATTERN = re.compile(rb'\[BOOT\] First MQTT publish (\d+) ms after boot')
+TIMEOUT_SEC = 120
+
+
+def reset(port):
+    port.dtr = False
+    port.rts = True
+    time.sleep(0.1)
+    port.rts = False
+    port.reset_input_buffer()
+
+
+def measure(port):
+    reset(port)
+    deadline = time.time() + TIMEOUT_SEC
+    while time.time() < deadline:
+        line = port.readline()
+        m = PATTERN.search(line)
+        if m:
+            return int(m.group(1))
+    return None
+
+
+def main():
+    device = sys.argv[1] if len(sys.argv) > 1 else '/dev/ttyUSB0'
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    results = []
+    with serial.Serial(device, 115200, timeout=1) as port:
+        for i in range(rounds):
+            ms = measure(port)
+            print('[BOOT] round {:>2}: {}'.format(i + 1, '{} ms'.format(ms) if ms is not None else 'timeout'))
+            if ms is not None:
+                results.append(ms)
+    if not results:
+        print('[BOOT] no measurement')
+        return
+    results.sort()
+    print('[BOOT] n={} min={} median={} max={} ms'.format(len(results), results[0], results[len(results) // 2], results[-1]))
+
+
+if __name__ == '__main__':
+    main()
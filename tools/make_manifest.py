@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# make_manifest.py - สร้าง manifest.json สำหรับ release (รันบนเครื่อง host ไม่ใช่บน ESP32)
+#
+#   python3 tools/make_manifest.py main > manifest.json      (รันจาก root ของ repo)
+#
+# แล้ว commit manifest.json ไว้ที่ root ของ repo (หรือใน github_src_dir) ก่อน tag release
+# OTAUpdater จะโหลดไฟล์นี้ไฟล์เดียวแทนการไล่ contents API ทีละโฟลเดอร์
+import hashlib
+import json
+import os
+import sys
+
+
+def git_blob_sha(data):
+    """SHA-1 แบบเดียวกับ `git hash-object` (ค่า sha ที่ contents API ส่งมา)"""
+    h = hashlib.sha1(b'blob %d\0' % len(data))
+    h.update(data)
+    return h.hexdigest()
+
+
+def build_manifest(root, version=None):
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != '__pycache__')
+        for name in sorted(filenames):
+            full = os.path.join(dirpath, name)
+            with open(full, 'rb') as f:
+                data = f.read()
+            files.append({
+                # path แบบเดียวกับใน git (relative กับ root ของ repo)
+                'path': os.path.relpath(full).replace(os.sep, '/'),
+                'size': len(data),
+                'sha': git_blob_sha(data),
+                'sha256': hashlib.sha256(data).hexdigest(),
+            })
+    manifest = {'files': files}
+    if version:
+        manifest['version'] = version
+    return manifest
+
+
+def main(argv):
+    if len(argv) < 2:
+        print('usage: make_manifest.py <main_dir> [version]', file=sys.stderr)
+        return 2
+    json.dump(build_manifest(argv[1], argv[2] if len(argv) > 2 else None), sys.stdout, indent=1)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
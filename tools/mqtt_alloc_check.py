@@ -0,0 +1,87 @@
+# mqtt_alloc_check.py - วัด heap ที่ใช้ต่อ 1 publish ของ health (gc.mem_alloc() ก่อน/หลัง) บน MicroPython unix port
+#
+#   cd <repo> && micropython tools/mqtt_alloc_check.py
+#
+# ไม่ต่อ broker จริง: client ถูกทำให้ "connected" กับ stream ที่ทิ้งข้อมูล วัดเฉพาะทาง publish ของเรา
+# เทียบ publish_health (PayloadWriter + topic bytes) กับทางเดิม (dict + ujson.dumps + f-string topic)
+# ที่คาดว่าเหลือต่อ publish คือ coroutine frame ของ await แต่ละชั้น + memoryview ของ packet
+# ยังไม่เคยรันบน unix port (ตอนเขียนไม่มี micropython ให้ใช้): ยังไม่มีตัวเลขจริง ให้ดูผลจากสคริปต์นี้
+# ไม่มีเกณฑ์ผ่าน/ไม่ผ่าน ตัวเลขที่ได้คือสิ่งที่ต้องบันทึกไว้เทียบ
+import sys
+sys.path.insert(0, '.')
+import gc
+import time
+import asyncio
+
+try:
+    from machine import unique_id
+except ImportError:
+    # unix port ไม่มี machine.unique_id
+    class machine:
+        @staticmethod
+        def unique_id():
+            return b'\x01\x02\x03\x04\x05\x06'
+    sys.modules['machine'] = machine
+
+from mqtt import MQTTManager
+from app.mqtt_client import AsyncMQTTClient
+
+ROUNDS = 100
+WARMUP = 10
+
+
+class NullStream:
+    # แทน stream ของ socket: นับ byte แล้วทิ้ง
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, buf):
+        self.bytes += len(buf)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+async def measure(name, publish):
+    for _ in range(WARMUP):
+        await publish()
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    for _ in range(ROUNDS):
+        await publish()
+    used = gc.mem_alloc() - before
+    gc.enable()
+    print('[ALLOC] {:<28} {:>6} bytes/publish'.format(name, used // ROUNDS))
+    return used // ROUNDS
+
+
+async def main():
+    for encoding in ('json', 'cbor'):
+        mqtt = MQTTManager(server='localhost', encoding=encoding)
+        client = AsyncMQTTClient(mqtt.client_id, 'localhost', keepalive=0)
+        client._writer = NullStream()
+        client.connected = True
+        mqtt.client = client
+        mqtt.connected = True
+
+        async def health():
+            await mqtt.publish_health('online', force=True)
+
+        async def legacy():
+            await mqtt.publish(f"{mqtt.topic_prefix}/health", {
+                "state": "online",
+                "timestamp": time.time(),
+                "device_id": mqtt.device_id,
+                "uptime": time.ticks_ms() // 1000
+            }, retain=True)
+
+        used = await measure('publish_health ' + encoding, health)
+        legacy_used = await measure('dict publish ' + encoding, legacy)
+        print('[ALLOC] {:<28} {:>6} bytes/publish'.format('saved ' + encoding, legacy_used - used))
+
+
+asyncio.run(main())
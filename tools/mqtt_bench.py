@@ -0,0 +1,98 @@
+# mqtt_bench.py - เทียบ umqtt.simple กับ AsyncMQTTClient: loop latency ระหว่าง connect/publish และ publish rate
+# QoS 1: umqtt.simple รอ PUBACK ทีละข้อความ, AsyncMQTTClient ส่งต่อกันได้ทีละ window (นับเวลาจนได้ ack ครบ)
+#
+#   python3 tools/mqtt_broker.py 1883 50          (บนเครื่อง host, หน่วง 50 ms ต่อ packet)
+#   mpremote run tools/mqtt_bench.py              (แก้ BROKER ด้านล่างเป็น ip ของ host ก่อน)
+#
+# ระหว่างทดสอบมี ticker task ตื่นทุก TICK_MS: lag = เวลาที่ตื่นช้ากว่ากำหนด (max) = loop ถูกบล็อกนานแค่ไหน
+import gc, time
+import uasyncio as asyncio
+from umqtt.simple import MQTTClient
+from app.mqtt_client import AsyncMQTTClient
+from wifi import WiFiManager
+
+BROKER = '192.168.1.10'
+PORT = 1883
+COUNT = 200
+TICK_MS = 10
+PAYLOAD = b'{"state": "online", "uptime": 123456, "free_mem": 98765}'
+TOPIC = 'esp/bench/health'
+
+
+class Ticker:
+
+    def __init__(self):
+        self.max_lag = 0
+        self.ticks = 0
+
+    async def run(self):
+        due = time.ticks_add(time.ticks_ms(), TICK_MS)
+        while True:
+            await asyncio.sleep_ms(max(0, time.ticks_diff(due, time.ticks_ms())))
+            lag = time.ticks_diff(time.ticks_ms(), due)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            self.ticks += 1
+            due = time.ticks_add(due, TICK_MS)
+
+
+def report(name, connect_ms, publish_ms, ticker):
+    rate = COUNT * 1000 // publish_ms if publish_ms else 0
+    print('[BENCH] {:<16} connect {:>5} ms  {:>5} msg/s  max loop lag {:>5} ms  ticks {:>5}  free={}'.format(
+        name, connect_ms, rate, ticker.max_lag, ticker.ticks, gc.mem_free()))
+
+
+async def bench_umqtt(qos=0):
+    ticker = Ticker()
+    task = asyncio.create_task(ticker.run())
+    await asyncio.sleep_ms(0)
+    client = MQTTClient('bench_sync', BROKER, port=PORT)
+    start = time.ticks_ms()
+    client.connect()
+    connect_ms = time.ticks_diff(time.ticks_ms(), start)
+    start = time.ticks_ms()
+    for _ in range(COUNT):
+        client.publish(TOPIC, PAYLOAD, qos=qos)
+        # ให้ task อื่นได้ทำงานเหมือนใน main.py
+        await asyncio.sleep_ms(0)
+    publish_ms = time.ticks_diff(time.ticks_ms(), start)
+    client.disconnect()
+    task.cancel()
+    report('umqtt qos{}'.format(qos), connect_ms, publish_ms, ticker)
+
+
+async def bench_async(qos=0, window=8):
+    ticker = Ticker()
+    task = asyncio.create_task(ticker.run())
+    await asyncio.sleep_ms(0)
+    client = AsyncMQTTClient('bench_async', BROKER, port=PORT, window=window)
+    start = time.ticks_ms()
+    await client.connect()
+    connect_ms = time.ticks_diff(time.ticks_ms(), start)
+    start = time.ticks_ms()
+    for _ in range(COUNT):
+        await client.publish(TOPIC, PAYLOAD, qos=qos)
+    await client.wait_acked(10000)
+    publish_ms = time.ticks_diff(time.ticks_ms(), start)
+    await client.disconnect()
+    task.cancel()
+    name = 'async qos{}'.format(qos) + (' w{}'.format(window) if qos else '')
+    report(name, connect_ms, publish_ms, ticker)
+
+
+def main():
+    wm = WiFiManager()
+    if not wm.auto_connect(start_ap_if_fail=False, wait=True):
+        print('[BENCH] WiFi not connected')
+        return
+    for qos in (0, 1):
+        gc.collect()
+        asyncio.run(bench_umqtt(qos))
+    gc.collect()
+    asyncio.run(bench_async())
+    for window in (1, 4, 8):
+        gc.collect()
+        asyncio.run(bench_async(1, window))
+
+
+main()
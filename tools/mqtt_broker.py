@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# mqtt_broker.py - MQTT 3.1.1 broker ขนาดเล็กสำหรับทดสอบในวง LAN (รันบนเครื่อง host ไม่ใช่บน ESP32)
+#
+#   python3 tools/mqtt_broker.py [port] [delay_ms]
+#
+# delay_ms = หน่วงทุก packet ที่ broker ส่งออก (จำลองลิงก์ไกล) โดยไม่หยุดอ่าน packet ถัดไประหว่างรอ ใช้คู่กับ tools/mqtt_bench.py
+# รองรับ CONNECT, PUBLISH (QoS 0/1, retain), SUBSCRIBE (+ / #), UNSUBSCRIBE, PINGREQ, DISCONNECT, Last Will
+# ไม่มี auth, ไม่เก็บ session, QoS 2 ถูกลดเป็น 1
+import asyncio
+import struct
+import sys
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(pattern, topic):
+    p = pattern.split('/')
+    t = topic.split('/')
+    for i, part in enumerate(p):
+        if part == '#':
+            return True
+        if i >= len(t) or (part != '+' and part != t[i]):
+            return False
+    return len(p) == len(t)
+
+
+def packet(kind, flags, body):
+    n = len(body)
+    head = bytearray([kind << 4 | flags])
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        head.append(b | 0x80 if n else b)
+        if not n:
+            return bytes(head) + body
+
+
+def _str(data, pos):
+    n = struct.unpack_from('!H', data, pos)[0]
+    return data[pos + 2:pos + 2 + n], pos + 2 + n
+
+
+class Session:
+
+    def __init__(self, broker, reader, writer):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.client_id = '?'
+        self.subs = {}
+        self.will = None
+        self.pid = 0
+
+    async def send(self, kind, flags, body):
+        if self.broker.delay:
+            await asyncio.sleep(self.broker.delay)
+        self.writer.write(packet(kind, flags, body))
+        await self.writer.drain()
+
+    def reply(self, kind, flags, body):
+        # ไม่รอ: packet ขาเข้าถัดไปอ่านต่อได้ระหว่างที่คำตอบยังหน่วงอยู่ (ลำดับคงเดิม delay เท่ากันทุก packet)
+        asyncio.ensure_future(self.send(kind, flags, body))
+
+    def deliver(self, topic, msg, qos, retain=False):
+        qos = min(qos, max(q for f, q in self.subs.items() if topic_matches(f, topic)))
+        body = struct.pack('!H', len(topic)) + topic.encode()
+        if qos:
+            self.pid = self.pid % 0xFFFF + 1
+            body += struct.pack('!H', self.pid)
+        self.reply(PUBLISH, qos << 1 | (1 if retain else 0), body + msg)
+
+    async def read_packet(self):
+        op = (await self.reader.readexactly(1))[0]
+        n = shift = 0
+        while True:
+            b = (await self.reader.readexactly(1))[0]
+            n |= (b & 0x7F) << shift
+            if not b & 0x80:
+                break
+            shift += 7
+        return op >> 4, op & 0x0F, await self.reader.readexactly(n)
+
+    async def run(self):
+        lost = True
+        try:
+            kind, flags, body = await self.read_packet()
+            if kind != CONNECT:
+                return
+            conn_flags = body[7]
+            self.client_id, pos = _str(body, 10)
+            self.client_id = self.client_id.decode()
+            if conn_flags & 0x04:
+                topic, pos = _str(body, pos)
+                msg, pos = _str(body, pos)
+                self.will = (topic.decode(), msg, (conn_flags >> 3) & 3, bool(conn_flags & 0x20))
+            self.broker.attach(self)
+            self.reply(CONNACK, 0, b'\x00\x00')
+            print('[BROKER] {} connected'.format(self.client_id))
+            while True:
+                kind, flags, body = await self.read_packet()
+                if kind == PUBLISH:
+                    topic, pos = _str(body, 0)
+                    qos = (flags >> 1) & 3
+                    if qos:
+                        pid = body[pos:pos + 2]
+                        pos += 2
+                        self.reply(PUBACK, 0, pid)
+                    self.broker.publish(topic.decode(), body[pos:], min(qos, 1), bool(flags & 1))
+                elif kind == SUBSCRIBE:
+                    pid, pos = body[:2], 2
+                    granted = bytearray()
+                    topics = []
+                    while pos < len(body):
+                        topic, pos = _str(body, pos)
+                        self.subs[topic.decode()] = min(body[pos], 1)
+                        granted.append(min(body[pos], 1))
+                        topics.append(topic.decode())
+                        pos += 1
+                    self.reply(SUBACK, 0, pid + bytes(granted))
+                    for topic in topics:
+                        self.broker.send_retained(self, topic)
+                elif kind == UNSUBSCRIBE:
+                    pos = 2
+                    while pos < len(body):
+                        topic, pos = _str(body, pos)
+                        self.subs.pop(topic.decode(), None)
+                    self.reply(UNSUBACK, 0, body[:2])
+                elif kind == PINGREQ:
+                    self.reply(PINGRESP, 0, b'')
+                elif kind == DISCONNECT:
+                    lost = False
+                    self.will = None
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.broker.detach(self)
+            if self.will:
+                self.broker.publish(*self.will)
+            self.writer.close()
+            print('[BROKER] {} {}'.format(self.client_id, 'lost' if lost else 'disconnected'))
+
+
+class Broker:
+
+    def __init__(self, delay_ms=0):
+        self.delay = delay_ms / 1000
+        self.sessions = []
+        self.retained = {}
+        self.received = 0
+
+    def attach(self, session):
+        self.sessions.append(session)
+
+    def detach(self, session):
+        if session in self.sessions:
+            self.sessions.remove(session)
+
+    def publish(self, topic, msg, qos=0, retain=False):
+        self.received += 1
+        if retain:
+            if msg:
+                self.retained[topic] = (msg, qos)
+            else:
+                self.retained.pop(topic, None)
+        for s in self.sessions:
+            if any(topic_matches(f, topic) for f in s.subs):
+                s.deliver(topic, msg, qos)
+
+    def send_retained(self, session, pattern):
+        for topic, (msg, qos) in self.retained.items():
+            if topic_matches(pattern, topic):
+                session.deliver(topic, msg, qos, retain=True)
+
+    async def handle(self, reader, writer):
+        await Session(self, reader, writer).run()
+
+
+async def serve(port=1883, delay_ms=0, host='0.0.0.0'):
+    broker = Broker(delay_ms)
+    server = await asyncio.start_server(broker.handle, host, port)
+    print('MQTT broker on {}:{} (delay {} ms)'.format(host, port, delay_ms))
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv):
+    port = int(argv[1]) if len(argv) > 1 else 1883
+    delay_ms = int(argv[2]) if len(argv) > 2 else 0
+    try:
+        asyncio.run(serve(port, delay_ms))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
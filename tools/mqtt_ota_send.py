@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# mqtt_ota_send.py - ส่ง release ให้ ESP32 ผ่าน MQTT broker (รันบนเครื่อง host ไม่ใช่บน ESP32)
+#
+#   pip install paho-mqtt
+#   python3 tools/mqtt_ota_send.py <broker> <version> main              (ทุกเครื่อง: esp/all/ota/...)
+#   python3 tools/mqtt_ota_send.py <broker> <version> main <device_id>  (เครื่องเดียว)
+#
+# ประกาศ manifest แบบ retained แล้วตอบ ack ของแต่ละเครื่อง (esp/+/ota/ack) ด้วย chunk ทีละ window
+# ฝั่งเครื่องใช้ OTAUpdater(transport=MQTTTransport(mqtt), mqtt=mqtt) กับ install_update_if_available_async()
+import struct
+import sys
+import json
+
+from make_manifest import build_manifest
+
+CHUNK_SIZE = 2048
+
+
+def main(argv):
+    if len(argv) < 4:
+        print('usage: mqtt_ota_send.py <broker> <version> <main_dir> [device_id] [chunk_size]', file=sys.stderr)
+        return 2
+    try:
+        import paho.mqtt.client as mqtt
+    except ImportError:
+        print('paho-mqtt is required: pip install paho-mqtt', file=sys.stderr)
+        return 2
+    broker, version, main_dir = argv[1:4]
+    device = argv[4] if len(argv) > 4 else 'all'
+    chunk_size = int(argv[5]) if len(argv) > 5 else CHUNK_SIZE
+
+    manifest = build_manifest(main_dir, version)
+    manifest['chunk_size'] = chunk_size
+    files = manifest['files']
+    # อ่านไฟล์ไว้ก่อน ตอบ ack ได้ทันทีโดยไม่ต้องเปิดไฟล์ซ้ำ
+    data = []
+    for f in files:
+        with open(f['path'], 'rb') as fh:
+            data.append(fh.read())
+
+    def on_connect(client, userdata, flags, rc, *args):
+        client.subscribe('esp/+/ota/ack' if device == 'all' else 'esp/{}/ota/ack'.format(device))
+        client.publish('esp/{}/ota/manifest'.format(device), json.dumps(manifest), qos=1, retain=True)
+        print('Announced {} ({} files) on esp/{}/ota/manifest'.format(version, len(files), device))
+
+    def on_message(client, userdata, msg):
+        ack = json.loads(msg.payload)
+        if ack.get('version') != version:
+            return
+        index = ack['file']
+        body = data[index]
+        start = ack['next']
+        total = (len(body) + chunk_size - 1) // chunk_size
+        chunk_topic = msg.topic[:-len('ack')] + 'chunk'
+        if start >= total:
+            print('{}: {} done'.format(msg.topic.split('/')[1], files[index]['path']))
+            return
+        for seq in range(start, min(start + ack.get('window', 1), total)):
+            payload = struct.pack('>HI', index, seq) + body[seq * chunk_size:(seq + 1) * chunk_size]
+            client.publish(chunk_topic, payload, qos=0)
+
+    client = mqtt.Client()
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(broker)
+    try:
+        client.loop_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,134 @@
+# mqtt_qos_check.py - เช็คว่า QoS 1 ที่ส่งไม่สำเร็จถึง broker ครั้งเดียวหลังต่อใหม่ (ไม่ซ้ำจาก inflight + คิว)
+#
+#   cd <repo> && micropython tools/mqtt_qos_check.py
+#
+# ไม่ต่อ broker จริง: open_connection ถูกแทนด้วย FakeBroker ที่ตอบ CONNACK/PUBACK และนับ PUBLISH ที่ได้รับ
+# ตั้ง fail = n ให้ write ของ PUBLISH ไป TOPIC ล้มเหลว n ครั้ง (เหมือน socket หลุดระหว่างส่ง)
+import sys
+sys.path.insert(0, '.')
+import struct
+import uasyncio as asyncio
+
+try:
+    from machine import unique_id
+except ImportError:
+    # unix port ไม่มี machine.unique_id
+    class machine:
+        @staticmethod
+        def unique_id():
+            return b'\x01\x02\x03\x04\x05\x06'
+    sys.modules['machine'] = machine
+
+from mqtt import MQTTManager
+from app import mqtt_client
+
+TOPIC = 'esp/test/qos'
+
+
+class FakeConn:
+    # reader + writer ของหนึ่งการเชื่อมต่อ: write ทีละ packet (AsyncMQTTClient._write ส่งครั้งละ packet)
+    def __init__(self, broker):
+        self.broker = broker
+        self.rx = bytearray(b'\x20\x02\x00\x00')
+        self.event = asyncio.Event()
+        self.closed = False
+
+    async def readexactly(self, n):
+        while len(self.rx) < n:
+            if self.closed:
+                raise OSError('closed')
+            self.event.clear()
+            await self.event.wait()
+        data = bytes(self.rx[:n])
+        self.rx = self.rx[n:]
+        return data
+
+    def write(self, buf):
+        if self.closed:
+            raise OSError('closed')
+        buf = bytes(buf)
+        if buf[0] & 0xF0 != 0x30:
+            return
+        pos = 1
+        while buf[pos] & 0x80:
+            pos += 1
+        pos += 1
+        topic_len = struct.unpack_from('!H', buf, pos)[0]
+        topic = buf[pos + 2:pos + 2 + topic_len].decode()
+        pos += 2 + topic_len
+        qos = (buf[0] >> 1) & 0x03
+        pid = buf[pos:pos + 2] if qos else None
+        if qos:
+            pos += 2
+        if topic == TOPIC and self.broker.fail:
+            self.broker.fail -= 1
+            raise OSError('write failed')
+        if topic == TOPIC:
+            msg = buf[pos:].decode()
+            self.broker.received[msg] = self.broker.received.get(msg, 0) + 1
+        if qos:
+            self.rx += b'\x40\x02' + pid
+            self.event.set()
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+        self.event.set()
+
+    async def wait_closed(self):
+        pass
+
+
+class FakeBroker:
+    def __init__(self):
+        self.fail = 0
+        self.received = {}
+
+    async def open_connection(self, host, port, ssl=False):
+        conn = FakeConn(self)
+        return conn, conn
+
+
+def check(name, broker, expected):
+    ok = broker.received == expected
+    print('[QOS] {:<32} {} {}'.format(name, 'ok' if ok else 'FAIL', broker.received))
+    return ok
+
+
+async def main():
+    broker = FakeBroker()
+    mqtt_client.asyncio.open_connection = broker.open_connection
+    mqtt = MQTTManager(server='localhost', keepalive=0)
+    ok = True
+    assert await mqtt.connect()
+
+    # publish ที่ write ล้ม: ต้องอยู่ในคิวอย่างเดียว ไม่ค้างใน inflight ของ client
+    broker.fail = 1
+    assert not await mqtt.publish(TOPIC, 'm1', qos=1)
+    assert mqtt.client.pending() == 0, mqtt.client.pending()
+    assert not await mqtt.publish(TOPIC, 'm2', qos=1)
+    assert await mqtt.connect()
+    await asyncio.sleep_ms(10)
+    ok &= check('publish fails, reconnect', broker, {'m1': 1, 'm2': 1})
+
+    # flush ที่ล้มกลางทาง: ข้อความที่ส่งไม่ได้ยังอยู่ในคิว ส่งรอบถัดไปครั้งเดียว
+    broker.fail = 1
+    assert not await mqtt.publish(TOPIC, 'm3', qos=1)
+    assert not await mqtt.publish(TOPIC, 'm4', qos=1)
+    broker.fail = 1
+    await mqtt.connect()
+    await asyncio.sleep_ms(10)
+    if not mqtt.is_connected():
+        assert await mqtt.connect()
+    await asyncio.sleep_ms(10)
+    ok &= check('flush fails, reconnect', broker, {'m1': 1, 'm2': 1, 'm3': 1, 'm4': 1})
+
+    await mqtt.disconnect()
+    print('[QOS] ' + ('ok' if ok else 'FAILED'))
+    if not ok:
+        sys.exit(1)
+
+
+asyncio.run(main())
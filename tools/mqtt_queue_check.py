@@ -0,0 +1,82 @@
+# mqtt_queue_check.py - เช็ค MessageQueue + FlashRing ตอน path ของ spill file ยังไม่มี / สร้างไม่ได้
+#
+#   cd <repo> && python3 tools/mqtt_queue_check.py      (หรือ micropython tools/mqtt_queue_check.py)
+#
+# ทำงานในโฟลเดอร์ชั่วคราวใต้ cwd แล้วลบทิ้งตอนจบ
+import sys
+sys.path.insert(0, '.')
+import os
+
+from app.mqtt_queue import MessageQueue, FlashRing
+
+TMP = 'mqtt_queue_check.tmp'
+
+
+def rmtree(path):
+    for entry in os.listdir(path):
+        p = path + '/' + entry
+        if os.stat(p)[0] & 0x4000:
+            rmtree(p)
+        else:
+            os.remove(p)
+    os.rmdir(path)
+
+
+def fill(queue, n):
+    for i in range(n):
+        queue.push('esp/x/data', 'msg{}'.format(i))
+
+
+def drain(queue):
+    out = []
+    item = queue.peek()
+    while item is not None:
+        out.append(item[1])
+        queue.pop()
+        item = queue.peek()
+    return out
+
+
+def missing_dir():
+    # เหมือน /config ที่ยังไม่มีบนบอร์ดใหม่: สร้างโฟลเดอร์ให้แล้ว spill ได้ตามปกติ
+    ring = FlashRing(TMP + '/config/spill.bin', slots=4, slot_size=64)
+    assert not ring.disabled
+    queue = MessageQueue(size=2, max_bytes=1024, spill=ring)
+    fill(queue, 5)
+    assert queue.stats()['spill_disabled'] is False
+    assert ring.count == 3, ring.count
+    assert drain(queue) == [b'msg0', b'msg1', b'msg2', b'msg3', b'msg4']
+    # เปิดใหม่ (เหมือนรีบูต) ใช้ไฟล์เดิมได้
+    assert not FlashRing(TMP + '/config/spill.bin', slots=4, slot_size=64).disabled
+    print('missing dir: ok')
+
+
+def unavailable():
+    # parent เป็นไฟล์ สร้างโฟลเดอร์ไม่ได้: ไม่ raise ทำงานแบบ RAM อย่างเดียว ข้อความที่ล้นนับเป็น dropped
+    with open(TMP + '/file', 'w') as f:
+        f.write('x')
+    ring = FlashRing(TMP + '/file/sub/spill.bin', slots=4, slot_size=64)
+    assert ring.disabled
+    queue = MessageQueue(size=2, max_bytes=1024, spill=ring)
+    fill(queue, 5)
+    stats = queue.stats()
+    assert stats['spill_disabled'] is True
+    assert stats['dropped'] == 3, stats
+    assert drain(queue) == [b'msg3', b'msg4']
+    print('unavailable: ok', stats)
+
+
+def main():
+    try:
+        rmtree(TMP)
+    except OSError:
+        pass
+    os.mkdir(TMP)
+    try:
+        missing_dir()
+        unavailable()
+    finally:
+        rmtree(TMP)
+
+
+main()
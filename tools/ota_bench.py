@@ -0,0 +1,64 @@
+# ota_bench.py - วัดเวลา OTA แบบ sync เทียบ async กับ mirror ในวง LAN (รันบนบอร์ด ไม่ต้อง copy ลง flash)
+#
+#   python3 tools/ota_mirror.py serve mirror/ 8080        (บนเครื่อง host)
+#   mpremote run tools/ota_bench.py                       (แก้ MIRROR ด้านล่างเป็น ip ของ host ก่อน)
+#
+# ติดตั้งลงโฟลเดอร์ /bench แยกจากโค้ดจริง (slot pointer ก็อยู่ใน /bench) ทุกรอบเริ่มจากว่างเปล่า = ดาวน์โหลดครบทุกไฟล์
+import os, gc, time
+import uasyncio as asyncio
+from app.ota_updater import OTAUpdater
+from wifi import WiFiManager
+
+MIRROR = 'http://192.168.1.10:8080'
+REPO = 'Tatonq/esp32-home'
+BENCH_DIR = 'bench'
+
+
+class BenchUpdater(OTAUpdater):
+
+    def _notify_ota_complete(self):
+        # ไม่ต้องประกาศเวอร์ชั่นของรอบทดสอบไปที่ MQTT
+        pass
+
+
+def updater(**kwargs):
+    return BenchUpdater(REPO, module=BENCH_DIR, api_url=MIRROR, raw_url=MIRROR + '/raw',
+                        slot_file=BENCH_DIR + '/ota_slot', cache_file=None, state_file=None, **kwargs)
+
+
+def reset():
+    o = updater()
+    if o._exists_dir(BENCH_DIR):
+        o._rmtree(BENCH_DIR)
+    os.mkdir(BENCH_DIR)
+    gc.collect()
+
+
+def run(name, install):
+    reset()
+    start = time.ticks_ms()
+    ok = install()
+    elapsed = time.ticks_diff(time.ticks_ms(), start)
+    print('[BENCH] {:<22} {:>6} ms  ok={}  free={}'.format(name, elapsed, ok, gc.mem_free()))
+    return elapsed
+
+
+def main():
+    wm = WiFiManager()
+    if not wm.auto_connect(start_ap_if_fail=False, wait=True):
+        print('[BENCH] WiFi not connected')
+        return
+    results = {}
+    results['sync'] = run('sync', lambda: updater().install_update_if_available())
+    results['sync keep-alive'] = run('sync keep-alive', lambda: updater(keep_alive=True).install_update_if_available())
+    for n in (1, 2, 3):
+        name = 'async x{}'.format(n)
+        results[name] = run(name, lambda: asyncio.run(updater().install_update_if_available_async(concurrency=n)))
+    base = results['sync']
+    for name, ms in results.items():
+        print('[BENCH] {:<22} {:>5}%'.format(name, ms * 100 // base if base else 0))
+    reset()
+    os.rmdir(BENCH_DIR)
+
+
+main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# ota_mirror.py - mirror ของ GitHub endpoint ที่ OTAUpdater ใช้ สำหรับวง LAN (รันบนเครื่อง host ไม่ใช่บน ESP32)
+#
+#   python3 tools/ota_mirror.py add mirror/ Tatonq/esp32-home v1.2.3 .   (export tag จาก git checkout)
+#   python3 tools/ota_mirror.py serve mirror/ 8080
+#
+# แล้วตั้ง "ota_mirror_url": "http://<ip ของเครื่องนี้>:8080" ใน /config/github.json ของบอร์ด
+# (หรือ OTAUpdater(api_url=url, raw_url=url + '/raw'))
+#
+# โครงสร้างบน disk: <root>/<owner>/<repo>/<tag>/...ไฟล์ของ tag...
+#                    <root>/<owner>/<repo>/<tag>.assets/<ชื่อ asset>   (ถ้ามี เช่น main.tar.gz สำหรับ archive_name)
+#
+# endpoint ที่ตอบ (ทุกอย่างคำนวณไว้ก่อนตอนเริ่ม / kill -HUP เพื่อโหลดใหม่):
+#   GET /repos/<owner>/<repo>/releases/latest
+#   GET /repos/<owner>/<repo>/releases/tags/<tag>
+#   GET /repos/<owner>/<repo>/releases/assets/<tag>/<name>
+#   GET /repos/<owner>/<repo>/contents/<path>?ref=refs/tags/<tag>
+#   GET /raw/<owner>/<repo>/<tag>/<path>                          (= raw.githubusercontent.com)
+# ทุก response มี ETag (ตอบ 304 เมื่อ If-None-Match ตรง) และใช้ HTTP/1.1 keep-alive
+import hashlib
+import http.server
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import tarfile
+import threading
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from make_manifest import git_blob_sha
+
+
+def version_key(tag):
+    # ลำดับเดียวกับ OTAUpdater._compare_versions
+    try:
+        return [int(p) for p in tag.lstrip('v').split('.')] + [0, 0, 0]
+    except ValueError:
+        return [0, 0, 0]
+
+
+# URL ของ asset ต้องเป็น absolute: ใส่ host ที่บอร์ดใช้เรียกเข้ามาตอนตอบ
+BASE = '{base}'
+
+
+def _json(obj):
+    body = json.dumps(obj).encode()
+    return body, '"%s"' % hashlib.sha1(body).hexdigest(), 'application/json'
+
+
+class Mirror:
+
+    def __init__(self, root):
+        self.root = root
+        self.responses = {}
+        self.lock = threading.Lock()
+
+    def scan(self):
+        responses = {}
+        for owner in sorted(os.listdir(self.root)):
+            for repo in sorted(os.listdir(os.path.join(self.root, owner))):
+                self._scan_repo(responses, owner + '/' + repo)
+        with self.lock:
+            self.responses = responses
+        print('Mirror: {} responses from {}'.format(len(responses), self.root))
+
+    def _scan_repo(self, responses, repo):
+        repo_dir = os.path.join(self.root, repo)
+        tags = [t for t in os.listdir(repo_dir) if not t.endswith('.assets') and os.path.isdir(os.path.join(repo_dir, t))]
+        if not tags:
+            return
+        latest = max(tags, key=version_key)
+        for tag in tags:
+            release = {'tag_name': tag, 'name': tag, 'assets': []}
+            assets_dir = os.path.join(repo_dir, tag + '.assets')
+            if os.path.isdir(assets_dir):
+                for name in sorted(os.listdir(assets_dir)):
+                    path = '/repos/{}/releases/assets/{}/{}'.format(repo, tag, name)
+                    with open(os.path.join(assets_dir, name), 'rb') as f:
+                        data = f.read()
+                    responses[path] = (data, '"%s"' % git_blob_sha(data), 'application/octet-stream')
+                    release['assets'].append({'name': name, 'size': len(data), 'url': BASE + path})
+            responses['/repos/{}/releases/tags/{}'.format(repo, tag)] = _json(release)
+            if tag == latest:
+                responses['/repos/{}/releases/latest'.format(repo)] = _json(release)
+            self._scan_tree(responses, repo, tag, os.path.join(repo_dir, tag), '')
+
+    def _scan_tree(self, responses, repo, tag, tag_dir, rel):
+        entries = []
+        for name in sorted(os.listdir(os.path.join(tag_dir, rel))):
+            path = rel + '/' + name if rel else name
+            full = os.path.join(tag_dir, path)
+            if os.path.isdir(full):
+                self._scan_tree(responses, repo, tag, tag_dir, path)
+                entries.append({'name': name, 'path': path, 'type': 'dir', 'sha': None, 'size': 0})
+            else:
+                with open(full, 'rb') as f:
+                    data = f.read()
+                sha = git_blob_sha(data)
+                # blob sha เป็น ETag ได้เลย: เนื้อหาเดียวกัน = sha เดียวกัน
+                responses['/raw/{}/{}/{}'.format(repo, tag, path)] = (data, '"%s"' % sha, 'application/octet-stream')
+                entries.append({'name': name, 'path': path, 'type': 'file', 'sha': sha, 'size': len(data)})
+        responses[('/repos/{}/contents/{}'.format(repo, rel), tag)] = _json(entries)
+
+    def lookup(self, target):
+        url = urlsplit(target)
+        path = unquote(url.path).rstrip('/')
+        with self.lock:
+            if path.startswith('/repos/') and '/contents' in path:
+                ref = parse_qs(url.query).get('ref', [''])[0].replace('refs/tags/', '')
+                if path.endswith('/contents'):
+                    path += '/'
+                return self.responses.get((path, ref))
+            return self.responses.get(path)
+
+
+def make_handler(mirror):
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # header กับ body เขียนแยกกัน: ปิด Nagle ไม่ให้ body รอ delayed ACK ของบอร์ดทุก response
+        disable_nagle_algorithm = True
+
+        def _respond(self, send_body):
+            found = mirror.lookup(self.path)
+            if found is None:
+                body = b'{"message": "Not Found"}'
+                self.send_response(404)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+                return
+            body, etag, content_type = found
+            if content_type == 'application/json':
+                body = body.replace(BASE.encode(), b'http://' + self.headers.get('Host', '').encode())
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+
+        def do_GET(self):
+            self._respond(True)
+
+        def do_HEAD(self):
+            self._respond(False)
+
+    return Handler
+
+
+def add(root, repo, tag, git_dir='.'):
+    """Export tag of the git checkout at git_dir into the mirror."""
+    dest = os.path.join(root, repo, tag)
+    os.makedirs(dest, exist_ok=True)
+    data = subprocess.run(['git', '-C', git_dir, 'archive', '--format=tar', tag], check=True, stdout=subprocess.PIPE).stdout
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        tar.extractall(dest)
+    print('Added {} {} to {}'.format(repo, tag, dest))
+
+
+def serve(root, port=8080, host='0.0.0.0'):
+    mirror = Mirror(root)
+    mirror.scan()
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda *args: mirror.scan())
+    server = http.server.ThreadingHTTPServer((host, port), make_handler(mirror))
+    print('Serving OTA mirror on http://{}:{}'.format(host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return server
+
+
+def main(argv):
+    if len(argv) >= 5 and argv[1] == 'add':
+        add(argv[2], argv[3], argv[4], argv[5] if len(argv) > 5 else '.')
+        return 0
+    if len(argv) >= 3 and argv[1] == 'serve':
+        serve(argv[2], int(argv[3]) if len(argv) > 3 else 8080)
+        return 0
+    print('usage: ota_mirror.py add <root> <owner/repo> <tag> [git_dir]\n'
+          '       ota_mirror.py serve <root> [port]', file=sys.stderr)
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
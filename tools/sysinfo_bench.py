@@ -0,0 +1,36 @@
+# sysinfo_bench.py - เวลาเก็บ myos.collect_info_dict() แยกตามโหมด (static cache / section / field)
+#
+#   mpremote run tools/sysinfo_bench.py
+#
+# แถวแรกคือการเรียกครั้งแรกหลังบูต (static ยังไม่อยู่ใน cache) ที่เหลือเฉลี่ยจาก ROUNDS รอบ
+# section "mem" มี gc.collect() อยู่ข้างใน เวลาขึ้นกับขนาด heap ตอนนั้น
+import gc, time
+import myos
+
+ROUNDS = 20
+
+
+def timed(name, rounds, fn=myos.collect_info_dict, **kw):
+    gc.collect()
+    start = time.ticks_us()
+    for _ in range(rounds):
+        info = fn(**kw)
+    us = time.ticks_diff(time.ticks_us(), start) // rounds
+    print('[BENCH] {:<28} {:>8} us {:>4} keys'.format(name, us, len(info)))
+    return us
+
+
+def main():
+    myos._static = None
+    timed('full (cold static)', 1)
+    timed('full (cached static)', ROUNDS)
+    for sec in myos.SECTIONS:
+        timed('section ' + sec, ROUNDS, sections=(sec,))
+    timed('fields mem_free,sta_rssi', ROUNDS, fields=('mem_free', 'sta_rssi'))
+    timed('fields uptime', ROUNDS, fields=('uptime',))
+    timed('collect_metrics', ROUNDS, fn=myos.collect_metrics)
+    # print_info: เก็บทั้งหมดแล้ว format เป็นบรรทัด
+    timed('collect_info_lines', ROUNDS, fn=myos.collect_info_lines)
+
+
+main()
@@ -0,0 +1,52 @@
+# telemetry_bench.py - ขนาด payload และเวลา encode: JSON เทียบ compact CBOR (app/telemetry.py)
+#
+#   mpremote run tools/telemetry_bench.py
+#
+# payload หน้าตาเดียวกับที่ MQTTManager ส่งจริงในแต่ละ encoding (CBOR ไม่มี device_id)
+import gc, time
+import ujson
+import myos
+from app import telemetry
+
+ROUNDS = 200
+DEVICE_ID = '0123456789ab'
+
+
+def payloads(compact):
+    now = time.time()
+    uptime = time.ticks_ms() // 1000
+    out = [
+        ('health', {'state': 'online', 'timestamp': now, 'device_id': DEVICE_ID, 'uptime': uptime}),
+        ('status', {'status': 'online', 'timestamp': now, 'device_id': DEVICE_ID, 'data': {'source': 'boot'}}),
+        ('version', {'device_id': DEVICE_ID, 'timestamp': now, 'version': 'v1.2.3', 'source': 'boot'}),
+        ('sysinfo', {'device_id': DEVICE_ID, 'timestamp': now, 'sysinfo': myos.collect_info_dict()}),
+    ]
+    if compact:
+        for name, payload in out:
+            del payload['device_id']
+    return out
+
+
+def timed(fn, payload):
+    gc.collect()
+    start = time.ticks_us()
+    for _ in range(ROUNDS):
+        data = fn(payload)
+    return len(data), time.ticks_diff(time.ticks_us(), start) // ROUNDS
+
+
+def main():
+    json_rows = payloads(False)
+    cbor_rows = payloads(True)
+    total_json = total_cbor = 0
+    print('[BENCH] {:<8} {:>10} {:>10} {:>6} {:>10} {:>10}'.format('payload', 'json B', 'cbor B', 'size', 'json us', 'cbor us'))
+    for (name, j), (_, c) in zip(json_rows, cbor_rows):
+        j_size, j_us = timed(ujson.dumps, j)
+        c_size, c_us = timed(telemetry.encode, c)
+        total_json += j_size
+        total_cbor += c_size
+        print('[BENCH] {:<8} {:>10} {:>10} {:>5}% {:>10} {:>10}'.format(name, j_size, c_size, c_size * 100 // j_size, j_us, c_us))
+    print('[BENCH] {:<8} {:>10} {:>10} {:>5}%'.format('total', total_json, total_cbor, total_cbor * 100 // total_json))
+
+
+main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# telemetry_decode.py - ถอด payload ของบอร์ด (JSON หรือ compact CBOR จาก app/telemetry.py) บนเครื่อง host
+#
+#   python3 tools/telemetry_decode.py 0112a3...                   (hex ของ payload)
+#   pip install paho-mqtt
+#   python3 tools/telemetry_decode.py --sub <broker> ['esp/#']    (subscribe แล้วพิมพ์เป็น JSON)
+#
+# ใช้ KEYS ชุดเดียวกับบอร์ดจาก app/telemetry.py (import ตรงจาก repo)
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from app.telemetry import FORMAT_CBOR, decode  # noqa: E402
+
+
+def decode_payload(payload):
+    """Return the message as a dict, whichever encoding the device used."""
+    if payload[:1] == bytes([FORMAT_CBOR]):
+        return decode(payload)
+    return json.loads(payload)
+
+
+def subscribe(broker, topic='esp/#'):
+    try:
+        import paho.mqtt.client as mqtt
+    except ImportError:
+        print('paho-mqtt is required: pip install paho-mqtt', file=sys.stderr)
+        return 2
+
+    def on_connect(client, userdata, flags, rc, *args):
+        client.subscribe(topic)
+
+    def on_message(client, userdata, msg):
+        try:
+            body = json.dumps(decode_payload(msg.payload))
+        except ValueError as e:
+            body = '<{}: {}>'.format(e, msg.payload.hex())
+        print('{} ({} bytes) {}'.format(msg.topic, len(msg.payload), body))
+
+    client = mqtt.Client()
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(broker)
+    try:
+        client.loop_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv):
+    if len(argv) >= 3 and argv[1] == '--sub':
+        return subscribe(argv[2], argv[3] if len(argv) > 3 else 'esp/#')
+    if len(argv) == 2:
+        print(json.dumps(decode_payload(bytes.fromhex(argv[1])), indent=2))
+        return 0
+    print('usage: telemetry_decode.py <hex payload>\n'
+          '       telemetry_decode.py --sub <broker> [topic]', file=sys.stderr)
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
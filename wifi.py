@@ -7,8 +7,10 @@ CONFIG_DIR = "/config"
 CONFIG_PATH = CONFIG_DIR + "/wifi.json"
 
 class WiFiManager:
-    def __init__(self, config_path=CONFIG_PATH):
+    def __init__(self, config_path=CONFIG_PATH, mqtt=None):
         self.config_path = config_path
+        # MQTTManager ของแอป ส่งต่อให้ OTAUpdater ที่ portal สร้าง (ประกาศเวอร์ชั่นผ่าน session เดิม)
+        self.mqtt = mqtt
         self.sta = network.WLAN(network.STA_IF)
         self.ap  = network.WLAN(network.AP_IF)
         self._last_try_ms = 0
@@ -419,9 +421,16 @@ def _wm_add_portal_methods_to(cls):
                     await self._send_json(w, nets)
                 except Exception as e:
                     await self._send_json(w, {"error": str(e), "nets": []})
-            elif method == "GET" and path == "/sysinfo":
+            elif method == "GET" and path.split("?", 1)[0] == "/sysinfo":
+                # /sysinfo?sections=mem,sta หรือ /sysinfo?fields=mem_free,sta_rssi
                 import myos
-                await self._send_json(w, myos.get_info())
+                q = self._parse_form(path.split("?", 1)[1]) if "?" in path else {}
+                sections = q["sections"].split(",") if q.get("sections") else None
+                fields = q["fields"].split(",") if q.get("fields") else None
+                try:
+                    await self._send_json(w, myos.get_info(sections=sections, fields=fields))
+                except ValueError as e:
+                    await self._send_json(w, {"error": str(e)})
 
             elif method == "POST" and path == "/save":
                 body = req.split("\r\n\r\n", 1)[1] if "\r\n\r\n" in req else ""
@@ -438,15 +447,11 @@ def _wm_add_portal_methods_to(cls):
                 await self._send_json(w, {"ok": ok, "message": msg, "ip": self.ip_info(), "ssid": ssid})
             elif method == "POST" and path == "/ota/check":
                 from app.ota_updater import OTAUpdater
-                headers = {
-                    b"Accept": b"application/vnd.github+json",
-                    b"X-GitHub-Api-Version": b"2022-11-28",
-                }
-                o = OTAUpdater(
-                    github_repo="Tatonq/esp32-home",
+                o = OTAUpdater.from_config(
+                    "Tatonq/esp32-home",
                     main_dir="main", 
                     new_version_dir="next",
-                    headers=headers
+                    mqtt=self.mqtt
                 )
                 ok = False
                 try: